@@ -1,48 +1,305 @@
+from time import time
+from typing import Callable, Dict, List, Tuple
 from piece import Piece
 from game import Game
+from bitboard import EN_PASSANT, FLAGS, KING, NOISY, PAWN, PROMOTION, coords, unpackMove
+from transposition import EXACT, LOWER, UPPER, TranspositionTable
+from book import OpeningBook, ply
+from tablebase import Tablebases
+from evaluation import VALUES, taper
+
+# The king is only priced for exchanges, so that it never recaptures onto a defended square.
+SEE_VALUES = VALUES[:KING] + [10000]
+# Victim values indexed by Piece.value, the trailing 0 is picked up by Piece.EMPTY (-1).
+VICTIMS = VALUES * 2 + [0]
+# Frontier margins by remaining depth, in the same units as VALUES.
+FUTILITY_MARGINS = [0, 40, 100]
+RAZORING_MARGINS = [0, 60, 120]
+MATE = 1000000
+INFINITY = MATE + 1
+MAX_DEPTH = 64
+# Scores past it are mates, as far as MAX_DEPTH search plies plus the 253 plies of the longest tablebase mate.
+MATE_BOUND = MATE - 1000
+
 
 class MinMax:
-    def __init__(self, game: Game) -> None:
+    def __init__(self, game: Game, hashSize: float = 16, maxTime: float = None, nullMove: bool = True, lateMoveReductions: bool = True, futility: bool = True, razoring: bool = True, table: TranspositionTable = None, book: OpeningBook = None, bookDepth: int = 20, tablebases: Tablebases = None, values: List[int] = None) -> None:
         self.game = game
+        # Material weights of the evaluation, VALUES unless tuned; the differences are added to the tapered score.
+        self.values = values if values else VALUES
+        self.adjustments = [value - base for value, base in zip(self.values, VALUES)] if any(value != base for value, base in zip(self.values, VALUES)) else None
+        self.table = table if table else TranspositionTable(hashSize)
+        # Book moves are played without searching, up to bookDepth plies into the game.
+        self.book = book
+        self.bookDepth = bookDepth
+        # Positions covered by the tablebases are scored from them instead of being searched.
+        self.tablebases = tablebases
+        # Polled with the clock, returns True when the search must stop (used by helpers and cancellation).
+        self.interrupt: Callable[[], bool] = None
+        # Called after every completed iteration with (depth, score, best move, nodes, nodes per second).
+        self.onProgress: Callable[[int, int, Tuple, int, float], None] = None
+        self.maxTime = maxTime
+        self.nullMove = nullMove
+        self.lateMoveReductions = lateMoveReductions
+        self.futility = futility
+        self.razoring = razoring
+        self.pruned = {'nullMove': 0, 'lateMoveReductions': 0, 'futility': 0, 'razoring': 0}
+        self.deadline: float = None
+        self.stopped: bool = False
+        self.nodes: int = 0
+        self.depth: int = 0
+        self.score: int = 0
+        # nodes, depth, score, time and nodes per second of the last generate, kept with the move in the game logs.
+        self.stats: Dict = {}
+        # Moves are packed ints in the search (see bitboard.packMove), converted back when returned.
+        self.rootBest: int = 0
+        self.killers = [[0, 0] for _ in range(MAX_DEPTH + 1)]
+        self.history = [[0] * 64 for _ in range(12)]
 
-    def generate(self, game: Game = None, isMax: bool = True, depth: int = 2, move = None):
-        game = game if game else self.game
-        sign = -1 if isMax else 1
-        score = 0
-        scores = []
-        avm = []
-        for k in game.map:
-            avm += self.game.getAvailableMoves(*k)
+    def timeBudget(self, game: Game) -> float:
+        remaining = max(game.getRemainingTime(game.player), 0)
+        movesToGo = max(20, 51 - game.fullMove)
+        budget = max(remaining / movesToGo, 0.05)
+        return min(budget, self.maxTime) if self.maxTime else budget
+
+    def bookMove(self, game: Game) -> Tuple[int, int, Piece]:
+        return self.book.choose(game) if self.book and ply(game) < self.bookDepth else None
 
+    def generate(self, game: Game = None, depth: int = None, moveTime: float = None, startDepth: int = 1, deadline: float = None):
+        game = game if game else self.game
+        move = self.bookMove(game) or (self.tablebases.bestMove(game) if self.tablebases else None)
         if move:
-            if game.map[move[1]].hasSameTypeAs(Piece.P1_PAWN):
-                score += sign * 20
-            elif game.map[move[1]].hasSameTypeAs(Piece.P1_BISHOP):
-                score += sign * 70
-            elif game.map[move[1]].hasSameTypeAs(Piece.P1_KNIGHT):
-                score += sign * 80
-            elif game.map[move[1]].hasSameTypeAs(Piece.P1_ROOK):
-                score += sign * 120
-            elif game.map[move[1]].hasSameTypeAs(Piece.P1_QUEEN):
-                score += sign * 300
-            elif game.map[move[1]].hasSameTypeAs(Piece.P1_KING):
-                score += sign * 999999999
-            game.move(frm=move[0], to=move[1], do=False)
-
-        if not depth:
-            return score
-
-        for mv in avm:
-            ng = Game(lambda _: None, 9999)
-            ng.logs = game.logs.copy()
-            ng.map = game.map.copy()
-            ng.player = game.player
-            scores.append(self.generate(game=ng, isMax= not isMax, move=mv, depth=depth-1))
-
-        nsc = max(scores) if isMax else min(scores)
-        if not move:
-            return avm[scores.index(nsc)]
-
-        return nsc + score if mv else 0
+            self.nodes = self.depth = self.score = 0
+            self.stats = {'nodes': 0, 'depth': 0, 'score': 0, 'time': 0.0, 'nps': 0.0}
+            return coords(move[0]), coords(move[1]), move[2]
+        if moveTime is None and depth is None and deadline is None:
+            moveTime = self.timeBudget(game)
+        self.deadline = deadline if deadline else time() + moveTime if moveTime is not None else None
+        self.table.newSearch()
+        start = time()
+        self.stopped = False
+        self.nodes = 0
+        self.depth = 0
+        self.pruned = dict.fromkeys(self.pruned, 0)
+        self.killers = [[0, 0] for _ in range(MAX_DEPTH + 1)]
+        self.history = [[value // 2 for value in row] for row in self.history]
+        best = 0
+
+        for d in range(startDepth, (depth if depth else MAX_DEPTH) + 1):
+            self.rootBest = 0
+            score = self.search(game, d, -INFINITY, INFINITY, 0)
+            if self.rootBest:
+                best = self.rootBest
+            if self.stopped:
+                break
+            self.depth, self.score = d, score
+            if self.onProgress and best:
+                frm, to, promotion = unpackMove(best)
+                self.onProgress(d, score, (coords(frm), coords(to), promotion), self.nodes, self.nodes / max(time() - start, 1e-6))
+            if abs(score) >= MATE_BOUND:
+                break
+
+        if not best:
+            moves = game.packedMoves()
+            best = moves[0] if moves else 0
+        elapsed = time() - start
+        self.stats = {'nodes': self.nodes, 'depth': self.depth, 'score': self.score, 'time': elapsed, 'nps': self.nodes / max(elapsed, 1e-6)}
+        if not best:
+            return None
+        frm, to, promotion = unpackMove(best)
+        return coords(frm), coords(to), promotion
+
+    # Material and piece-square tables, kept up to date by the board on every move, tapered by the game phase.
+    def evaluate(self, game: Game) -> int:
+        board = game.map
+        score = taper(board.middlegame, board.endgame, board.phase)
+        if self.adjustments:
+            pieces = board.pieces
+            score += sum((pieces[kind].bit_count() - pieces[kind + 6].bit_count()) * adjustment for kind, adjustment in enumerate(self.adjustments[:KING]))
+        return score if game.player else -score
+
+    @staticmethod
+    def hasPieces(game: Game) -> bool:
+        offset = 0 if game.player else 6
+        pieces = game.map.pieces
+        return (pieces[offset + 1] | pieces[offset + 2] | pieces[offset + 3] | pieces[offset + 4]) != 0
+
+    def search(self, game: Game, depth: int, alpha: int, beta: int, ply: int, allowNull: bool = True) -> int:
+        if depth <= 0:
+            return self.quiesce(game, alpha, beta, ply)
+        self.nodes += 1
+        if not self.nodes & 1023 and (self.deadline and time() >= self.deadline or self.interrupt and self.interrupt()):
+            self.stopped = True
+        if self.stopped:
+            return 0
+
+        if self.tablebases and ply:
+            found = self.tablebases.probe(game)
+            if found:
+                result, plies = found
+                return result * (MATE - ply - plies) if result else 0
+
+        key = game.key
+        entry = self.table.probe(key)
+        ttMove = None
+        if entry:
+            ttDepth, bound, score, ttMove = entry
+            score = self.fromTable(score, ply)
+            if ply and ttDepth >= depth and (bound == EXACT or bound == LOWER and score >= beta or bound == UPPER and score <= alpha):
+                return score
+
+        inCheck = game.check()
+        moves = game.packedMoves()
+        if not moves:
+            return -MATE + ply if inCheck else 0
+
+        pvNode = beta - alpha > 1
+        selective = ply and not pvNode and not inCheck
+        staticEval = self.evaluate(game) if selective else None
+
+        if self.razoring and selective and depth < len(RAZORING_MARGINS) and staticEval + RAZORING_MARGINS[depth] < alpha:
+            score = self.quiesce(game, alpha - 1, alpha, ply)
+            if self.stopped:
+                return 0
+            if score < alpha:
+                self.pruned['razoring'] += 1
+                return score
+
+        # A pawn-only side is likely in zugzwang, where passing would be an illusion.
+        if self.nullMove and selective and allowNull and depth >= 3 and staticEval >= beta and self.hasPieces(game):
+            enPassant = game.makeNull()
+            score = -self.search(game, depth - 3 - depth // 6, -beta, -beta + 1, ply + 1, False)
+            game.unmakeNull(enPassant)
+            if self.stopped:
+                return 0
+            if score >= beta:
+                self.pruned['nullMove'] += 1
+                return beta if score >= MATE_BOUND else score
+
+        futile = self.futility and selective and depth < len(FUTILITY_MARGINS) and staticEval + FUTILITY_MARGINS[depth] <= alpha
+        self.orderMoves(game, moves, ttMove, ply)
+
+        alphaOrig = alpha
+        best, bestMove = -INFINITY, 0
+        squares = game.map.squares
+        for i, move in enumerate(moves):
+            quiet = squares[move >> 6 & 63] == Piece.EMPTY and not move & NOISY
+            undo = game.make(move)
+            givesCheck = game.check()
+            if i and quiet and not givesCheck and futile:
+                game.unmake(undo)
+                self.pruned['futility'] += 1
+                best = max(best, staticEval + FUTILITY_MARGINS[depth])
+                continue
+            if i == 0:
+                score = -self.search(game, depth - 1, -beta, -alpha, ply + 1)
+            else:
+                reduction = 0
+                if self.lateMoveReductions and depth >= 3 and i >= 3 and quiet and not inCheck and not givesCheck:
+                    reduction = 1 if i < 6 else 2
+                    self.pruned['lateMoveReductions'] += 1
+                score = -self.search(game, depth - 1 - reduction, -alpha - 1, -alpha, ply + 1)
+                if reduction and score > alpha:
+                    score = -self.search(game, depth - 1, -alpha - 1, -alpha, ply + 1)
+                if alpha < score < beta:
+                    score = -self.search(game, depth - 1, -beta, -alpha, ply + 1)
+            game.unmake(undo)
+            if self.stopped:
+                return 0
+            if score > best:
+                best, bestMove = score, move
+                if score > alpha:
+                    alpha = score
+                    if not ply:
+                        self.rootBest = move
+                    if alpha >= beta:
+                        if quiet:
+                            self.storeKiller(game, move, depth, ply)
+                        break
+
+        bound = UPPER if best <= alphaOrig else LOWER if best >= beta else EXACT
+        self.table.store(key, depth, bound, self.toTable(best, ply), bestMove)
+        return best
+
+    def quiesce(self, game: Game, alpha: int, beta: int, ply: int) -> int:
+        self.nodes += 1
+        if not self.nodes & 1023 and (self.deadline and time() >= self.deadline or self.interrupt and self.interrupt()):
+            self.stopped = True
+        if self.stopped:
+            return 0
+
+        # In check every evasion is searched and standing pat is not an option.
+        inCheck = game.check()
+        if inCheck:
+            moves = game.packedMoves()
+            if not moves:
+                return -MATE + ply
+            best = -INFINITY
+        else:
+            best = self.evaluate(game)
+            if best >= beta or ply >= MAX_DEPTH:
+                return best
+            moves = game.packedMoves(captures=True)
+        alpha = max(alpha, best)
+        self.orderMoves(game, moves, None, ply)
+
+        squares = game.map.squares
+        for move in moves:
+            frm, to = move & 63, move >> 6 & 63
+            if not inCheck and not move & NOISY and VICTIMS[squares[to].value] < VALUES[squares[frm].value % 6] and game.map.see(frm, to, SEE_VALUES) < 0:
+                continue
+            undo = game.make(move)
+            score = -self.quiesce(game, -beta, -alpha, ply + 1)
+            game.unmake(undo)
+            if self.stopped:
+                return 0
+            if score > best:
+                best = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return best
+
+    def orderMoves(self, game: Game, moves: List[int], ttMove: int, ply: int) -> None:
+        squares = game.map.squares
+        killers = self.killers[min(ply, MAX_DEPTH)]
+        history = self.history
+
+        def score(move: int) -> int:
+            if move == ttMove:
+                return 1 << 30
+            frm, to, flags = move & 63, move >> 6 & 63, move >> FLAGS
+            piece = squares[frm]
+            promotion = flags & PROMOTION
+            victim = VICTIMS[squares[to].value] if flags != EN_PASSANT else VALUES[PAWN]
+            if victim or promotion:
+                # MVV-LVA, with captures losing material on exchange sorted after the quiet moves.
+                mvvlva = (victim + (VALUES[flags & 7] if promotion else 0)) * 16 - VALUES[piece.value % 6] // 8
+                if victim and not promotion and victim < VALUES[piece.value % 6] and game.map.see(frm, to, SEE_VALUES) < 0:
+                    return -(1 << 20) + mvvlva
+                return (1 << 28) + mvvlva
+            if move == killers[0]:
+                return 1 << 27
+            if move == killers[1]:
+                return 1 << 26
+            return history[piece.value][to]
+
+        moves.sort(key=score, reverse=True)
+
+    def storeKiller(self, game: Game, move: int, depth: int, ply: int) -> None:
+        killers = self.killers[min(ply, MAX_DEPTH)]
+        if killers[0] != move:
+            killers[1], killers[0] = killers[0], move
+        row = self.history[game.map.squares[move & 63].value]
+        to = move >> 6 & 63
+        row[to] = min(row[to] + depth * depth, 1 << 25)
 
+    # Mate scores are stored relative to the node, not to the root.
+    @staticmethod
+    def toTable(score: int, ply: int) -> int:
+        return score + ply if score >= MATE_BOUND else score - ply if score <= -MATE_BOUND else score
 
+    @staticmethod
+    def fromTable(score: int, ply: int) -> int:
+        return score - ply if score >= MATE_BOUND else score + ply if score <= -MATE_BOUND else score
@@ -0,0 +1,262 @@
+import json
+import math
+import multiprocessing
+from argparse import ArgumentParser
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import combinations
+from time import time
+from typing import Dict, Iterator, List, Tuple
+from bitboard import coords
+from database import DatabaseWriter, fromGame
+from game import Game, Result, START_FEN
+from IA import MAX_DEPTH, MinMax
+from piece import Piece
+from tablebase import Tablebases
+import pgn
+
+# An engine is a name and the keyword arguments of its MinMax, "values" overriding the material weights.
+Engine = Tuple[str, Dict]
+# An opening is a start position and the moves played from it before the engines take over.
+Opening = Tuple[str, List[Tuple[int, int, Piece]]]
+# Clocks are not used by the arena, the per move limits keep the games short.
+NO_CLOCK = 10 ** 9
+POINTS = {'1-0': 1, '0-1': 0, '1/2-1/2': 0.5}
+
+
+def parseEngine(words: List[str]) -> Engine:
+    # "name key=value ...", values being json ("values=[20,70,80,120,320,0]", "nullMove=false").
+    options = {}
+    for word in words[1:]:
+        if '=' not in word:
+            raise ValueError(f"engine option {word} is not key=value")
+        key, value = word.split('=', 1)
+        try:
+            options[key] = json.loads(value)
+        except json.JSONDecodeError:
+            options[key] = value
+    return words[0], options
+
+
+def loadOpenings(path: str, plies: int = 8) -> List[Opening]:
+    # A pgn suite gives the first plies of every game, any other file one fen or uci move list per line.
+    if path.endswith('.pgn'):
+        return [(tags.get('FEN', START_FEN), moves[:plies]) for tags, moves in pgn.readGames(path)]
+    openings = []
+    with open(path) as file:
+        for text in file:
+            text = text.split('#')[0].strip()
+            if not text:
+                continue
+            if '/' in text:
+                openings.append((Game.fromFEN(text).toFEN(), []))
+                continue
+            game, moves = Game(lambda: None, None), []
+            for word in text.split():
+                move = game.parseUci(word)
+                if not move:
+                    raise ValueError(f"illegal opening move {word} in {text}")
+                game.make(move)
+                moves.append(move)
+            openings.append((START_FEN, moves))
+    return openings
+
+
+def adjudicate(game: Game, repetitions: Dict[int, int], maxPlies: int) -> Tuple[str, str]:
+    # Draw rules Game does not enforce, then its own verdict: mate, stalemate or tablebase result.
+    if repetitions[game.key] >= 3:
+        return '1/2-1/2', 'repetition'
+    if game.halfMove >= 100:
+        return '1/2-1/2', 'fifty moves'
+    if game.map.occupied.bit_count() == 2:
+        return '1/2-1/2', 'insufficient material'
+    if len(game.logs) >= maxPlies:
+        return '1/2-1/2', 'max plies'
+    result = game.winner()
+    if result == Result.RUNNING:
+        return None, None
+    reason = 'tablebases' if game.tablebases and game.tablebases.probe(game) else 'mate' if game.inCheck() else 'stalemate'
+    return {Result.P1: '1-0', Result.P2: '0-1'}.get(result, '1/2-1/2'), reason
+
+
+def playGame(opening: Opening, white: Engine, black: Engine, limits: Dict, tablebases: str = None) -> Tuple[str, str, Game]:
+    fen, moves = opening
+    game = Game.fromFEN(fen, allowedTime=NO_CLOCK) if fen != START_FEN else Game(lambda: None, NO_CLOCK)
+    game.playerW.name, game.playerB.name = white[0], black[0]
+    game.tablebases = Tablebases(tablebases) if tablebases else None
+    for frm, to, promotion in moves:
+        game.move(coords(frm), coords(to), promoted=promotion, do=False, moveCost=0)
+    engines = {}
+    for player, (_, options) in ((True, white), (False, black)):
+        engine = engines[player] = MinMax(game, hashSize=limits['hashSize'], **options)
+        if limits['nodes']:
+            engine.interrupt = lambda engine=engine: engine.nodes >= limits['nodes']
+    repetitions = {game.key: 1}
+    while True:
+        result, reason = adjudicate(game, repetitions, limits['maxPlies'])
+        if result:
+            break
+        start = time()
+        move = engines[game.player].generate(game, depth=limits['depth'] or (None if limits['moveTime'] else MAX_DEPTH), moveTime=limits['moveTime'])
+        game.move(move[0], move[1], promoted=move[2], do=False, moveCost=time() - start)
+        game.logs[-1].stats = engines[not game.player].stats
+        repetitions[game.key] = repetitions.get(game.key, 0) + 1
+    if game.tablebases:
+        game.tablebases.close()
+        game.tablebases = None
+    return result, reason, game
+
+
+def _play(round: int, opening: Opening, white: Engine, black: Engine, limits: Dict, tablebases: str) -> Tuple[int, str, str, Engine, Engine, str, Tuple]:
+    # Runs in a worker: the game goes back as its pgn text and its database record.
+    result, reason, game = playGame(opening, white, black, limits, tablebases)
+    game.round = round
+    record = fromGame(game)
+    record[0].update({'Result': result, 'Termination': reason})
+    return round, result, reason, white, black, game.toPGN(result, {'Termination': reason}), record
+
+
+def schedule(engines: List[Engine], openings: List[Opening], games: int) -> Iterator[Tuple[Opening, Engine, Engine]]:
+    # Every pair of engines plays every opening twice, colours reversed, until the number of games is reached.
+    count, i = 0, 0
+    while count < games:
+        opening = openings[i % len(openings)]
+        for first, second in combinations(engines, 2):
+            for white, black in ((first, second), (second, first)):
+                if count == games:
+                    return
+                yield opening, white, black
+                count += 1
+        i += 1
+
+
+def elo(wins: int, draws: int, losses: int) -> Tuple[float, float]:
+    # Elo difference and its 95% error margin, from the mean and variance of the game scores.
+    n = wins + draws + losses
+    if not n:
+        return 0.0, math.inf
+    score = (wins + draws / 2) / n
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / n
+    margin = 1.959964 * math.sqrt(variance / n)
+    return difference(score), (difference(min(score + margin, 1)) - difference(max(score - margin, 0))) / 2
+
+
+def difference(score: float) -> float:
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+
+def expected(elo: float) -> float:
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def sprt(wins: int, draws: int, losses: int, elo0: float, elo1: float) -> float:
+    # Log likelihood ratio of elo1 against elo0, with the normal approximation of the trinomial score.
+    n = wins + draws + losses
+    if not n or not wins + losses:
+        return 0.0
+    score = (wins + draws / 2) / n
+    variance = ((wins + draws / 4) / n - score ** 2) / n
+    if variance <= 0:
+        return 0.0
+    s0, s1 = expected(elo0), expected(elo1)
+    return (s1 - s0) * (2 * score - s0 - s1) / (2 * variance)
+
+
+def bounds(alpha: float, beta: float) -> Tuple[float, float]:
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def run(engines: List[Engine], openings: List[Opening], games: int, limits: Dict, jobs: int = 1, output: str = None,
+        tablebases: str = None, test: Tuple[float, float, float, float] = None, onGame=None) -> Dict[Tuple[str, str], List[int]]:
+    # Plays the games on a pool of processes and streams them to the output as they end.
+    # Returns the wins, draws and losses of the first engine of every pair; test stops early once the sprt decides.
+    results = {(first[0], second[0]): [0, 0, 0] for first, second in combinations(engines, 2)}
+    names = [engine[0] for engine in engines]
+    pgnFile = open(output, 'a') if output and output.endswith('.pgn') else None
+    writer = DatabaseWriter(output) if output and not pgnFile else None
+    tasks = enumerate(schedule(engines, openings, games), 1)
+    jobs = jobs if jobs > 0 else multiprocessing.cpu_count()
+    with ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context('spawn')) as executor:
+        pending = set()
+        stopped = False
+        while True:
+            while not stopped and len(pending) < jobs * 2:
+                task = next(tasks, None)
+                if not task:
+                    break
+                round, (opening, white, black) = task
+                pending.add(executor.submit(_play, round, opening, white, black, limits, tablebases))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                round, result, reason, white, black, text, record = future.result()
+                if pgnFile:
+                    pgnFile.write(text + '\n')
+                    pgnFile.flush()
+                if writer:
+                    writer.add(*record)
+                first, second = sorted((white[0], black[0]), key=names.index)
+                points = POINTS[result] if white[0] == first else 1 - POINTS[result]
+                results[first, second][0 if points == 1 else 1 if points == 0.5 else 2] += 1
+                if onGame:
+                    onGame(round, white[0], black[0], result, reason, results)
+                if test and not stopped:
+                    llr = sprt(*results[names[0], names[1]], test[0], test[1])
+                    lower, upper = bounds(test[2], test[3])
+                    stopped = not lower < llr < upper
+    if pgnFile:
+        pgnFile.close()
+    if writer:
+        writer.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='play engine configurations against each other.')
+    parser.add_argument('-e', '--engine', nargs='+', action='append', required=True, metavar='NAME KEY=VALUE', help='engine name and MinMax options, json values; at least two.')
+    parser.add_argument('-n', '--games', type=int, default=100, help='number of games.')
+    parser.add_argument('-o', '--openings', help='pgn suite, or file with one fen or uci move list per line.')
+    parser.add_argument('-p', '--plies', type=int, default=8, help='plies of the pgn suite games used as openings.')
+    parser.add_argument('-d', '--depth', type=int, help='search depth per move.')
+    parser.add_argument('-t', '--movetime', type=float, help='search time per move, in seconds.')
+    parser.add_argument('-N', '--nodes', type=int, help='searched nodes per move.')
+    parser.add_argument('-m', '--max-plies', type=int, default=400, help='plies after which a game is drawn.')
+    parser.add_argument('-H', '--hash', type=float, default=4, help='transposition table size of every engine, in MB.')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='games played at once, 0 for one per cpu.')
+    parser.add_argument('-w', '--output', help='pgn file to append the games to, or binary game database to write.')
+    parser.add_argument('--tablebases', help='directory of endgame tablebases used to adjudicate.')
+    parser.add_argument('--sprt', type=float, nargs=2, metavar=('ELO0', 'ELO1'), help='stop when the sprt of the first two engines decides.')
+    parser.add_argument('--alpha', type=float, default=0.05, help='sprt false positive rate.')
+    parser.add_argument('--beta', type=float, default=0.05, help='sprt false negative rate.')
+    args = parser.parse_args()
+
+    engines = [parseEngine(words) for words in args.engine]
+    if len(engines) < 2 or len({name for name, _ in engines}) != len(engines):
+        parser.error('at least two engines with different names are needed')
+    if not (args.depth or args.movetime or args.nodes):
+        parser.error('a depth, time or node limit is needed')
+    openings = loadOpenings(args.openings, args.plies) if args.openings else [(START_FEN, [])]
+    limits = {'depth': args.depth, 'moveTime': args.movetime, 'nodes': args.nodes, 'maxPlies': args.max_plies, 'hashSize': args.hash}
+    test = (args.sprt[0], args.sprt[1], args.alpha, args.beta) if args.sprt else None
+
+    def onGame(round: int, white: str, black: str, result: str, reason: str, results: Dict) -> None:
+        wins, draws, losses = results[engines[0][0], engines[1][0]]
+        line = f"Game {round}: {white} - {black} {result} ({reason}), {engines[0][0]} +{wins} ={draws} -{losses}"
+        if test:
+            line += f", LLR {sprt(wins, draws, losses, test[0], test[1]):.2f}"
+        print(line, flush=True)
+
+    start = time()
+    results = run(engines, openings, args.games, limits, args.jobs, args.output, args.tablebases, test, onGame)
+    print(f"Time: {time() - start:.3f}s")
+    for (first, second), (wins, draws, losses) in results.items():
+        gain, margin = elo(wins, draws, losses)
+        print(f"{first} vs {second}: +{wins} ={draws} -{losses}, Elo {gain:+.1f} +/- {margin:.1f}")
+    if test:
+        llr = sprt(*results[engines[0][0], engines[1][0]], test[0], test[1])
+        lower, upper = bounds(test[2], test[3])
+        print(f"SPRT: LLR {llr:.2f} [{lower:.2f}, {upper:.2f}] {'H1 accepted' if llr >= upper else 'H0 accepted' if llr <= lower else 'undecided'}")
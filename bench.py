@@ -0,0 +1,135 @@
+import json
+import platform
+import sys
+from argparse import ArgumentParser
+from os.path import join
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter, time
+from typing import Callable, Dict, List
+from game import Game
+from IA import MinMax
+from piece import Piece
+
+OPENING = 'e2e4 e7e5 g1f3 b8c6 f1c4 f8c5 c2c3 g8f6 d2d4 e5d4 c3d4 c5b4'.split()
+
+
+def playout(plies: int, seed: int = 0, do: bool = False) -> Game:
+    # Deterministic pseudo random game, played through the public Game.move like the UI does.
+    random = Random(seed)
+    game = Game(lambda: None, None)
+    for _ in range(plies):
+        moves = game.legalMoves()
+        if not moves:
+            break
+        frm, to, promotion = moves[random.randrange(len(moves))]
+        game.move(divmod(frm, 8), divmod(to, 8), promoted=promotion, do=do)
+    return game
+
+
+def positions() -> Dict[str, Game]:
+    opening = Game(lambda: None, None)
+    for text in OPENING:
+        opening.make(opening.parseUci(text))
+    return {'start': Game(lambda: None, None), 'opening': opening, 'middlegame': playout(40, seed=1), 'endgame': playout(120, seed=2)}
+
+
+def measure(function: Callable, repeat: int) -> Dict:
+    runs = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        runs.append(perf_counter() - start)
+    return {'best': min(runs), 'mean': sum(runs) / len(runs), 'repeat': repeat}
+
+
+def benchmarks(quick: bool = False) -> Dict[str, Callable]:
+    games = positions()
+    replay = playout(60 if quick else 200, seed=3)
+    # Undoing every move then redoing them all gives the same game back, so it is played once.
+    chain = playout(20 if quick else 60, seed=4, do=True)
+    suite = {}
+
+    def uncached(game: Game, function: Callable) -> Callable:
+        # Game.status caches the position, every run starts from a cold cache so that move generation is timed.
+        def run():
+            game.cached = None
+            return function()
+        return run
+
+    for name, game in games.items():
+        squares = list(game.map)
+        suite[f'getMoves/{name}'] = lambda game=game, squares=squares: [Piece.getMoves(x=x, y=y, map=game.map, casteling=True, castling=game.castling, enPassant=game.enPassant) for x, y in squares]
+        suite[f'getAvailableMoves/{name}'] = uncached(game, lambda game=game, squares=squares: [game.getAvailableMoves(x, y) for x, y in squares])
+        suite[f'legalMoves/{name}'] = lambda game=game: [game.legalMoves() for _ in range(100)]
+        suite[f'check/{name}'] = lambda game=game: [game.check() for _ in range(100)]
+        suite[f'winner/{name}'] = uncached(game, game.winner)
+
+    for depth in (2, 3) if quick else (2, 3, 4):
+        def search(depth=depth):
+            game = Game.fromPosition(games['opening'].position())
+            MinMax(game, hashSize=1).generate(depth=depth)
+        suite[f'generate/depth{depth}'] = search
+
+    suite['playLog'] = lambda: replay.playLog(do=False)
+
+    def files():
+        with TemporaryDirectory() as directory:
+            replay.saveAsPGN(join(directory, 'game.pgn'))
+            replay.saveAsJSON(join(directory, 'game.json'))
+            Game.loadJson(join(directory, 'game.json'), lambda: None, None)
+    suite['saveAsPGN+saveAsJSON+loadJson'] = files
+
+    def undoRedo():
+        while chain.undoes:
+            chain.undo()
+        while chain.redos:
+            chain.redo()
+    suite['undo+redo'] = undoRedo
+    return suite
+
+
+def run(only: List[str] = None, repeat: int = 5, quick: bool = False) -> Dict:
+    results = {}
+    for name, function in benchmarks(quick).items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        results[name] = measure(function, repeat)
+        print(f"{name:40} {results[name]['best'] * 1000:10.3f} ms", file=sys.stderr)
+    return {'time': time(), 'python': platform.python_version(), 'machine': platform.machine(), 'quick': quick, 'results': results}
+
+
+def compare(report: Dict, baseline: Dict, threshold: float) -> List[str]:
+    regressions = []
+    for name, result in report['results'].items():
+        reference = baseline['results'].get(name)
+        if not reference:
+            continue
+        ratio = result['best'] / reference['best'] if reference['best'] else 1
+        flag = 'REGRESSION' if ratio > 1 + threshold else 'faster' if ratio < 1 - threshold else ''
+        print(f"{name:40} {reference['best'] * 1000:10.3f} -> {result['best'] * 1000:10.3f} ms  x{ratio:.2f} {flag}")
+        if flag == 'REGRESSION':
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='time the engine hot paths.')
+    parser.add_argument('-o', '--output', help='json file where to write the results.')
+    parser.add_argument('-c', '--compare', help='baseline json file to compare the results with.')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1, help='relative slowdown reported as a regression.')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='runs of every benchmark, the best one is kept.')
+    parser.add_argument('-q', '--quick', help='smaller workloads, for a quick check.', action='store_true')
+    parser.add_argument('names', nargs='*', help='only run the benchmarks starting with these names.')
+    args = parser.parse_args()
+
+    report = run(args.names, args.repeat, args.quick)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as baseline:
+            regressions = compare(report, json.load(baseline), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            exit(1)
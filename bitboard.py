@@ -0,0 +1,417 @@
+from random import Random
+from typing import Dict, Iterator, List, Tuple
+from piece import Piece
+from evaluation import ENDGAME, MIDDLEGAME, PIECE_PHASES
+
+# Squares are indexed x * 8 + y, following the (x, y) coordinates of Game.map:
+# square 0 is the black rook corner (a8) and square 63 the white one (h1).
+PAWN, BISHOP, KNIGHT, ROOK, QUEEN, KING = range(6)
+PIECES: List[Piece] = [Piece(value) for value in range(12)]
+
+ROOK_DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+BISHOP_DIRECTIONS = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+
+
+def square(x: int, y: int) -> int:
+    return x * 8 + y
+
+
+def coords(sq: int) -> Tuple[int, int]:
+    return divmod(sq, 8)
+
+
+# Move generation and search use 16 bit moves: from in bits 0-5, to in bits 6-11 and flags in bits 12-15,
+# either CASTLE, EN_PASSANT or PROMOTION with the kind of the promoted piece (BISHOP to QUEEN).
+CASTLE, EN_PASSANT, PROMOTION = 1, 2, 8
+FLAGS = 12
+# Flags of the moves that are neither quiet nor captures of the piece on the target square.
+NOISY = (EN_PASSANT | PROMOTION) << FLAGS
+
+
+def packMove(move: Tuple[int, int, Piece]) -> int:
+    # (from, to, promotion) moves are converted at the edges of the engine; castling and en passant flags
+    # are only set by the move generator, make() finds those moves without them.
+    if not move:
+        return 0
+    frm, to, promotion = move
+    return frm | to << 6 | ((PROMOTION | promotion.value % 6) << FLAGS if promotion else 0)
+
+
+def unpackMove(packed: int) -> Tuple[int, int, Piece]:
+    # The promoted piece takes the colour of the side whose last row is the target square.
+    if not packed:
+        return None
+    to, flags = packed >> 6 & 63, packed >> FLAGS
+    return packed & 63, to, Piece((flags & 7) + (0 if to < 8 else 6)) if flags & PROMOTION else None
+
+
+def lsb(bb: int) -> int:
+    return (bb & -bb).bit_length() - 1
+
+
+def bits(bb: int) -> Iterator[int]:
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+def _leaper(offsets: List[Tuple[int, int]]) -> List[int]:
+    table = []
+    for sq in range(64):
+        x, y = coords(sq)
+        table.append(sum(1 << square(x + i, y + j) for i, j in offsets if 0 <= x + i < 8 and 0 <= y + j < 8))
+    return table
+
+
+def _rays() -> List[List[int]]:
+    rays = []
+    for dx, dy in DIRECTIONS:
+        table = []
+        for sq in range(64):
+            x, y = coords(sq)
+            ray = 0
+            x, y = x + dx, y + dy
+            while 0 <= x < 8 and 0 <= y < 8:
+                ray |= 1 << square(x, y)
+                x, y = x + dx, y + dy
+            table.append(ray)
+        rays.append(table)
+    return rays
+
+
+KNIGHT_ATTACKS = _leaper([(i, j) for i in range(-2, 3) for j in range(-2, 3) if abs(i) + abs(j) == 3])
+KING_ATTACKS = _leaper([(i, j) for i in range(-1, 2) for j in range(-1, 2) if abs(i) + abs(j) != 0])
+# PAWN_ATTACKS[player][sq]: squares attacked by a pawn of `player` (True for white) standing on sq.
+PAWN_ATTACKS = [_leaper([(1, -1), (1, 1)]), _leaper([(-1, -1), (-1, 1)])]
+RAYS = _rays()
+# A ray whose square indices grow is blocked by its lowest set bit, otherwise by its highest one.
+POSITIVE = [dx * 8 + dy > 0 for dx, dy in DIRECTIONS]
+ROOK_RAYS = range(0, 4)
+BISHOP_RAYS = range(4, 8)
+
+
+def _between() -> List[List[int]]:
+    between = [[0] * 64 for _ in range(64)]
+    for rays in RAYS:
+        for sq in range(64):
+            for to in bits(rays[sq]):
+                between[sq][to] = rays[sq] & ~rays[to] & ~(1 << to)
+    return between
+
+
+# BETWEEN[a][b]: squares strictly between a and b when they share a line, 0 otherwise.
+BETWEEN = _between()
+
+# Castling rights, as a 4 bit mask.
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+ALL_CASTLING = 15
+# right: (king square, rook square, king destination, rook destination, squares that must be empty)
+CASTLING = {
+    WHITE_KINGSIDE: (60, 63, 62, 61, (1 << 61) | (1 << 62)),
+    WHITE_QUEENSIDE: (60, 56, 58, 59, (1 << 57) | (1 << 58) | (1 << 59)),
+    BLACK_KINGSIDE: (4, 7, 6, 5, (1 << 5) | (1 << 6)),
+    BLACK_QUEENSIDE: (4, 0, 2, 3, (1 << 1) | (1 << 2) | (1 << 3)),
+}
+PROMOTION_ROWS = 0xFF | 0xFF << 56
+# CASTLING_RIGHTS[sq]: rights kept after a move leaving from or landing on sq.
+CASTLING_RIGHTS = [ALL_CASTLING & ~sum(right for right, (king, rook, _, _, _) in CASTLING.items() if sq in (king, rook)) for sq in range(64)]
+
+# Zobrist keys, drawn from a fixed seed so that hashes are stable across runs and processes.
+_random = Random(0x5A0B)
+ZOBRIST_PIECES = [[_random.getrandbits(64) for _ in range(64)] for _ in range(12)]
+ZOBRIST_SIDE = _random.getrandbits(64)
+ZOBRIST_CASTLING = [_random.getrandbits(64) for _ in range(16)]
+ZOBRIST_EN_PASSANT = [_random.getrandbits(64) for _ in range(8)]
+
+
+def sliderAttacks(sq: int, occupied: int, directions: range) -> int:
+    attacks = 0
+    for d in directions:
+        ray = RAYS[d][sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= RAYS[d][lsb(blockers) if POSITIVE[d] else blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+
+class Bitboard:
+    __slots__ = ('pieces', 'occupancy', 'squares', 'hash', 'middlegame', 'endgame', 'phase')
+
+    def __init__(self) -> None:
+        self.pieces: List[int] = [0] * 12
+        # occupancy[player] where player is True for white, as everywhere else in the game.
+        self.occupancy: List[int] = [0, 0]
+        self.squares: List[Piece] = [Piece.EMPTY] * 64
+        # Zobrist key of the pieces only, Game.key adds the side to move, castling and en passant.
+        self.hash: int = 0
+        # Middlegame and endgame scores of the pieces for white, and game phase (see evaluation.taper).
+        self.middlegame: int = 0
+        self.endgame: int = 0
+        self.phase: int = 0
+
+    @staticmethod
+    def fromMap(map: Dict[Tuple[int, int], Piece]):
+        board = Bitboard()
+        for (x, y), piece in map.items():
+            if piece != Piece.EMPTY:
+                board.put(square(x, y), piece)
+        return board
+
+    @staticmethod
+    def fromPieces(pieces: List[int]):
+        board = Bitboard()
+        for value, bb in enumerate(pieces):
+            for sq in bits(bb):
+                board.put(sq, PIECES[value])
+        return board
+
+    def toMap(self) -> Dict[Tuple[int, int], Piece]:
+        return {coords(sq): piece for sq, piece in enumerate(self.squares)}
+
+    def copy(self):
+        board = Bitboard.__new__(Bitboard)
+        board.pieces = self.pieces.copy()
+        board.occupancy = self.occupancy.copy()
+        board.squares = self.squares.copy()
+        board.hash = self.hash
+        board.middlegame = self.middlegame
+        board.endgame = self.endgame
+        board.phase = self.phase
+        return board
+
+    @property
+    def occupied(self) -> int:
+        return self.occupancy[0] | self.occupancy[1]
+
+    def put(self, sq: int, piece: Piece) -> None:
+        bit = 1 << sq
+        self.pieces[piece.value] |= bit
+        self.occupancy[piece.value < 6] |= bit
+        self.squares[sq] = piece
+        self.hash ^= ZOBRIST_PIECES[piece.value][sq]
+        self.middlegame += MIDDLEGAME[piece.value][sq]
+        self.endgame += ENDGAME[piece.value][sq]
+        self.phase += PIECE_PHASES[piece.value]
+
+    def remove(self, sq: int) -> Piece:
+        piece = self.squares[sq]
+        if piece != Piece.EMPTY:
+            bit = ~(1 << sq)
+            self.pieces[piece.value] &= bit
+            self.occupancy[piece.value < 6] &= bit
+            self.squares[sq] = Piece.EMPTY
+            self.hash ^= ZOBRIST_PIECES[piece.value][sq]
+            self.middlegame -= MIDDLEGAME[piece.value][sq]
+            self.endgame -= ENDGAME[piece.value][sq]
+            self.phase -= PIECE_PHASES[piece.value]
+        return piece
+
+    def king(self, player: bool) -> int:
+        king = self.pieces[KING if player else KING + 6]
+        return lsb(king) if king else None
+
+    def attacks(self, sq: int, occupied: int = None) -> int:
+        piece = self.squares[sq]
+        kind = piece.value % 6
+        occupied = self.occupied if occupied is None else occupied
+        if kind == KNIGHT:
+            return KNIGHT_ATTACKS[sq]
+        if kind == KING:
+            return KING_ATTACKS[sq]
+        if kind == PAWN:
+            return PAWN_ATTACKS[piece.value < 6][sq]
+        return (sliderAttacks(sq, occupied, ROOK_RAYS) if kind != BISHOP else 0) | (sliderAttacks(sq, occupied, BISHOP_RAYS) if kind != ROOK else 0)
+
+    def attackersTo(self, sq: int, player: bool, occupied: int = None) -> int:
+        occupied = self.occupied if occupied is None else occupied
+        offset = 0 if player else 6
+        pieces = self.pieces
+        queens = pieces[QUEEN + offset]
+        return (PAWN_ATTACKS[not player][sq] & pieces[PAWN + offset]) |\
+            (KNIGHT_ATTACKS[sq] & pieces[KNIGHT + offset]) |\
+            (KING_ATTACKS[sq] & pieces[KING + offset]) |\
+            (sliderAttacks(sq, occupied, ROOK_RAYS) & (pieces[ROOK + offset] | queens)) |\
+            (sliderAttacks(sq, occupied, BISHOP_RAYS) & (pieces[BISHOP + offset] | queens))
+
+    def isAttacked(self, sq: int, player: bool, occupied: int = None) -> bool:
+        return self.attackersTo(sq, player, occupied) != 0
+
+    def pawnPushes(self, sq: int, player: bool) -> int:
+        empty = ~self.occupied
+        step = -8 if player else 8
+        one = (1 << (sq + step)) & empty if 0 <= sq + step < 64 else 0
+        if one and sq // 8 == (6 if player else 1):
+            return one | ((1 << (sq + 2 * step)) & empty)
+        return one
+
+    def see(self, frm: int, to: int, values: List[int]) -> int:
+        # Static exchange evaluation of a capture on `to`, both sides recapturing with their least valuable attacker.
+        gain = [values[self.squares[to].value % 6] if self.squares[to] != Piece.EMPTY else 0]
+        attacker = self.squares[frm]
+        value = values[attacker.value % 6]
+        player = attacker.value >= 6
+        occupied = self.occupied ^ (1 << frm)
+        while True:
+            gain.append(value - gain[-1])
+            attackers = self.attackersTo(to, player, occupied) & occupied
+            if not attackers:
+                break
+            offset = 0 if player else 6
+            for kind in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING):
+                candidates = attackers & self.pieces[kind + offset]
+                if candidates:
+                    break
+            occupied ^= candidates & -candidates
+            value = values[kind]
+            player = not player
+        for d in range(len(gain) - 2, 0, -1):
+            gain[d - 1] = -max(-gain[d - 1], gain[d])
+        return gain[0]
+
+    def pinned(self, king: int, player: bool) -> Dict[int, int]:
+        offset = 6 if player else 0
+        pieces = self.pieces
+        queens = pieces[QUEEN + offset]
+        enemies = self.occupancy[not player]
+        snipers = (sliderAttacks(king, enemies, ROOK_RAYS) & (pieces[ROOK + offset] | queens)) |\
+            (sliderAttacks(king, enemies, BISHOP_RAYS) & (pieces[BISHOP + offset] | queens))
+        pins = {}
+        occupied = self.occupied
+        own = self.occupancy[player]
+        for sniper in bits(snipers):
+            between = BETWEEN[king][sniper]
+            blockers = between & occupied
+            if blockers and blockers & (blockers - 1) == 0 and blockers & own:
+                pins[lsb(blockers)] = between | (1 << sniper)
+        return pins
+
+    def legalMoves(self, player: bool, castling: int = 0, enPassant: int = None, origins: int = -1, captures: bool = False) -> List[Tuple[int, int, Piece]]:
+        return [unpackMove(move) for move in self.packedMoves(player, castling, enPassant, origins, captures)]
+
+    def packedMoves(self, player: bool, castling: int = 0, enPassant: int = None, origins: int = -1, captures: bool = False) -> List[int]:
+        moves = []
+        king = self.king(player)
+        if king is None:
+            return moves
+        them = not player
+        own = self.occupancy[player]
+        enemies = self.occupancy[them]
+        occupied = own | enemies
+        offset = 0 if player else 6
+        # With captures set, only captures, en passant and promotions are generated.
+        scope = enemies if captures else ~own
+
+        if origins & (1 << king):
+            withoutKing = occupied ^ (1 << king)
+            for to in bits(KING_ATTACKS[king] & scope):
+                if not self.attackersTo(to, them, withoutKing):
+                    moves.append(king | to << 6)
+
+        checkers = self.attackersTo(king, them, occupied)
+        if checkers & (checkers - 1):
+            return moves
+        target = ~own if not checkers else BETWEEN[king][lsb(checkers)] | checkers
+        pins = self.pinned(king, player)
+
+        if not checkers and not captures and origins & (1 << king):
+            for right, (kingSq, rookSq, kingTo, rookTo, empty) in CASTLING.items():
+                if castling & right and king == kingSq and self.squares[rookSq] == PIECES[ROOK + offset] and not occupied & empty\
+                        and not self.attackersTo(kingTo, them, occupied) and not self.attackersTo((kingSq + kingTo) // 2, them, occupied):
+                    moves.append(king | kingTo << 6 | CASTLE << FLAGS)
+
+        promotions = [(PROMOTION | kind) << FLAGS for kind in (QUEEN, ROOK, BISHOP, KNIGHT)]
+        lastRow = 0 if player else 7
+        step = -8 if player else 8
+        startRow = 6 if player else 1
+        empty = ~occupied
+        for frm in bits(self.pieces[PAWN + offset] & origins):
+            allowed = target & pins.get(frm, -1) & (enemies | PROMOTION_ROWS if captures else -1)
+            targets = PAWN_ATTACKS[player][frm] & enemies
+            one = frm + step
+            # A pawn left on the last row while Game.move waits for its promotion has nowhere to go.
+            if 0 <= one < 64 and (1 << one) & empty:
+                targets |= 1 << one
+                if frm // 8 == startRow and (1 << (one + step)) & empty:
+                    targets |= 1 << (one + step)
+            for to in bits(targets & allowed):
+                if to // 8 == lastRow:
+                    moves += [frm | to << 6 | promotion for promotion in promotions]
+                else:
+                    moves.append(frm | to << 6)
+            if enPassant is not None and PAWN_ATTACKS[player][frm] & (1 << enPassant):
+                captured = enPassant - step
+                after = (occupied ^ (1 << frm) ^ (1 << captured)) | (1 << enPassant)
+                if not self.attackersTo(king, them, after) & ~(1 << captured):
+                    moves.append(frm | enPassant << 6 | EN_PASSANT << FLAGS)
+
+        for kind in (KNIGHT, BISHOP, ROOK, QUEEN):
+            for frm in bits(self.pieces[kind + offset] & origins):
+                allowed = target & pins.get(frm, -1) & scope
+                if kind == KNIGHT:
+                    targets = KNIGHT_ATTACKS[frm]
+                else:
+                    targets = (sliderAttacks(frm, occupied, ROOK_RAYS) if kind != BISHOP else 0) | (sliderAttacks(frm, occupied, BISHOP_RAYS) if kind != ROOK else 0)
+                moves += [frm | to << 6 for to in bits(targets & allowed)]
+        return moves
+
+    def getMoves(self, x: int, y: int, player: bool = None, casteling: bool = False, castling: int = 0, enPassant: int = None) -> List:
+        sq = square(x, y)
+        piece = self.squares[sq]
+        if piece == Piece.EMPTY or player is not None and player != (piece.value < 6):
+            return []
+        player = piece.value < 6
+        kind = piece.value % 6
+        if kind == PAWN:
+            targets = self.pawnPushes(sq, player) | (PAWN_ATTACKS[player][sq] & (self.occupancy[not player] | (0 if enPassant is None else 1 << enPassant)))
+        else:
+            targets = self.attacks(sq) & ~self.occupancy[player]
+        moves = [((x, y), coords(to)) for to in bits(targets)]
+        if kind == KING and casteling and castling:
+            moves += [((x, y), coords(move >> 6 & 63)) for move in self.packedMoves(player, castling, origins=1 << sq) if move >> FLAGS == CASTLE]
+        return moves
+
+    # Mapping protocol, so a Bitboard can stand in for the dict[(x, y)] -> Piece map.
+    def __getitem__(self, key: Tuple[int, int]) -> Piece:
+        return self.squares[key[0] * 8 + key[1]]
+
+    def __setitem__(self, key: Tuple[int, int], piece: Piece) -> None:
+        sq = key[0] * 8 + key[1]
+        self.remove(sq)
+        if piece != Piece.EMPTY:
+            self.put(sq, piece)
+
+    def get(self, key: Tuple[int, int], default: Piece = None) -> Piece:
+        return self[key] if key in self else default
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, tuple) and len(key) == 2 and key[0] in range(8) and key[1] in range(8)
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return (coords(sq) for sq in range(64))
+
+    def __len__(self) -> int:
+        return 64
+
+    def keys(self) -> Iterator[Tuple[int, int]]:
+        return iter(self)
+
+    def values(self) -> List[Piece]:
+        return self.squares.copy()
+
+    def items(self) -> Iterator[Tuple[Tuple[int, int], Piece]]:
+        return ((coords(sq), piece) for sq, piece in enumerate(self.squares))
+
+    def clear(self) -> None:
+        self.pieces = [0] * 12
+        self.occupancy = [0, 0]
+        self.squares = [Piece.EMPTY] * 64
+        self.hash = 0
+        self.middlegame = self.endgame = self.phase = 0
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Bitboard):
+            return self.squares == other.squares
+        return isinstance(other, dict) and self.toMap() == other
@@ -0,0 +1,112 @@
+import struct
+from argparse import ArgumentParser
+from collections import defaultdict
+from mmap import ACCESS_READ, mmap
+from random import Random
+from time import time
+from typing import Dict, Iterable, List, Tuple
+from database import Database
+from game import Game
+from piece import Piece
+from bitboard import packMove, unpackMove
+import pgn
+
+# File layout: header, then entries sorted by position key, the most played move first.
+MAGIC = b'CHBK'
+VERSION = 2
+HEADER = struct.Struct('<4sHxxI')
+# position key, packed move, number of games where the move was played
+ENTRY = struct.Struct('<QHI')
+
+
+def ply(game: Game) -> int:
+    return (game.fullMove - 1) * 2 + (0 if game.player else 1)
+
+
+def collect(games: Iterable[Tuple[Dict[str, str], List[Tuple[int, int, Piece]]]], plies: int = 20, stats: Dict[int, Dict[int, int]] = None) -> Dict[int, Dict[int, int]]:
+    # Counts, for every position key met in the first plies of the games, how many times each move was played.
+    stats = stats if stats is not None else defaultdict(lambda: defaultdict(int))
+    for record in games:
+        tags, moves = record[0], record[1]
+        game = Game.fromFEN(tags['FEN']) if 'FEN' in tags else Game(lambda: None, None)
+        for move in moves:
+            if ply(game) >= plies:
+                break
+            stats[game.key][packMove(move)] += 1
+            game.make(move)
+    return stats
+
+
+def write(path: str, stats: Dict[int, Dict[int, int]], minCount: int = 1) -> int:
+    entries = sorted((key, -count, move) for key, moves in stats.items() for move, count in moves.items() if count >= minCount)
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+        file.write(b''.join(ENTRY.pack(key, move, -count) for key, count, move in entries))
+    return len(entries)
+
+
+class OpeningBook:
+    def __init__(self, path: str, seed: int = None) -> None:
+        self.file = open(path, 'rb')
+        self.map = mmap(self.file.fileno(), 0, access=ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not an opening book")
+        self.random = Random(seed)
+
+    def key(self, index: int) -> int:
+        return struct.unpack_from('<Q', self.map, HEADER.size + index * ENTRY.size)[0]
+
+    def lookup(self, key: int) -> List[Tuple[Tuple[int, int, Piece], int]]:
+        # Binary search of the first entry of the key, then the entries that follow it.
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        moves = []
+        while low < self.count:
+            entryKey, move, count = ENTRY.unpack_from(self.map, HEADER.size + low * ENTRY.size)
+            if entryKey != key:
+                break
+            moves.append((unpackMove(move), count))
+            low += 1
+        return moves
+
+    def choose(self, game: Game, minCount: int = 1) -> Tuple[int, int, Piece]:
+        # Weighted random pick among the book moves, checked against the legal moves in case of a key collision.
+        legal = game.legalMoves()
+        moves = [(move, count) for move, count in self.lookup(game.key) if count >= minCount and move in legal]
+        if not moves:
+            return None
+        pick = self.random.randrange(sum(count for _, count in moves))
+        for move, count in moves:
+            pick -= count
+            if pick < 0:
+                return move
+
+    def close(self) -> None:
+        self.map.close()
+        self.file.close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='build an opening book from pgn files or game databases.')
+    parser.add_argument('book', help='book file to write.')
+    parser.add_argument('inputs', nargs='+', help='pgn files or binary game databases.')
+    parser.add_argument('-p', '--plies', type=int, default=20, help='plies of every game that go into the book.')
+    parser.add_argument('-m', '--min', type=int, default=2, help='games a move must appear in to be kept.')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='pgn parsing processes, 0 for one per cpu.')
+    args = parser.parse_args()
+
+    start = time()
+    stats = defaultdict(lambda: defaultdict(int))
+    for path in args.inputs:
+        collect(pgn.readGames(path, args.jobs, onError=None) if path.endswith('.pgn') else Database(path), args.plies, stats)
+    entries = write(args.book, stats, args.min)
+    print(f"Positions: {len(stats)}")
+    print(f"Entries: {entries}")
+    print(f"Time: {time() - start:.3f}s")
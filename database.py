@@ -0,0 +1,185 @@
+import json
+import struct
+from argparse import ArgumentParser
+from mmap import ACCESS_READ, mmap
+from os.path import getsize
+from re import sub
+from time import time
+from typing import Dict, Iterator, List, Tuple
+from bitboard import coords, packMove, square, unpackMove
+from game import Game
+from piece import Piece
+import pgn
+
+# File layout: header, game records, then the index of the records.
+#   header: magic, version, game count, index offset
+#   record: tags as utf-8 "name\tvalue" lines, backslash, tab and newline escaped, then one fixed width entry per move
+#   index:  record offset, tags length and move count of every game
+MAGIC = b'CHDB'
+VERSION = 3
+HEADER = struct.Struct('<4sHxxIQ')
+INDEX = struct.Struct('<QII')
+# A move entry is the 16 bit packed move and the time spent on it, in tenths of a second.
+MOVE = struct.Struct('<HH')
+MAX_COST = 0xFFFF
+# Tags kept by fromGame for toGame only, the clocks of the game.
+CLOCK_TAGS = ('Time', 'AllowedTime')
+ESCAPES = {'\\': '\\\\', '\t': '\\t', '\n': '\\n'}
+UNESCAPES = {'\\': '\\', 't': '\t', 'n': '\n'}
+
+# (tags, moves as (from, to, promotion), seconds spent on every move)
+Record = Tuple[Dict[str, str], List[Tuple[int, int, Piece]], List[float]]
+
+
+def escape(text: str) -> str:
+    return ''.join(ESCAPES.get(char, char) for char in str(text))
+
+
+def unescape(text: str) -> str:
+    return sub(r'\\(.)', lambda match: UNESCAPES.get(match.group(1), match.group(1)), text)
+
+
+class DatabaseWriter:
+    def __init__(self, path: str) -> None:
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+        self.index = bytearray()
+        self.count: int = 0
+
+    def add(self, tags: Dict[str, str], moves: List[Tuple[int, int, Piece]], costs: List[float] = None) -> None:
+        offset = self.file.tell()
+        text = '\n'.join(f"{escape(name)}\t{escape(value)}" for name, value in tags.items()).encode('utf-8')
+        costs = costs if costs else [0] * len(moves)
+        self.file.write(text)
+        self.file.write(b''.join(MOVE.pack(packMove(move), min(max(round(cost * 10), 0), MAX_COST)) for move, cost in zip(moves, costs)))
+        self.index += INDEX.pack(offset, len(text), len(moves))
+        self.count += 1
+
+    def close(self) -> None:
+        offset = self.file.tell()
+        self.file.write(self.index)
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.count, offset))
+        self.file.close()
+
+
+class Database:
+    def __init__(self, path: str) -> None:
+        self.file = open(path, 'rb')
+        self.map = mmap(self.file.fileno(), 0, access=ACCESS_READ)
+        magic, version, self.count, self.indexOffset = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a game database")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def entry(self, n: int) -> Tuple[int, int, int]:
+        if not 0 <= n < self.count:
+            raise IndexError(f"no game {n}")
+        return INDEX.unpack_from(self.map, self.indexOffset + n * INDEX.size)
+
+    def tags(self, n: int) -> Dict[str, str]:
+        offset, length, _ = self.entry(n)
+        text = self.map[offset:offset + length].decode('utf-8')
+        return dict(map(unescape, line.split('\t', 1)) for line in text.split('\n')) if text else {}
+
+    def moveCount(self, n: int) -> int:
+        return self.entry(n)[2]
+
+    def move(self, n: int, m: int) -> Tuple[int, int, Piece]:
+        offset, length, count = self.entry(n)
+        if not 0 <= m < count:
+            raise IndexError(f"no move {m} in game {n}")
+        return unpackMove(MOVE.unpack_from(self.map, offset + length + m * MOVE.size)[0])
+
+    def moves(self, n: int) -> List[Tuple[int, int, Piece]]:
+        offset, length, count = self.entry(n)
+        return [unpackMove(packed) for packed, _ in MOVE.iter_unpack(self.map[offset + length:offset + length + count * MOVE.size])]
+
+    def costs(self, n: int) -> List[float]:
+        offset, length, count = self.entry(n)
+        return [cost / 10 for _, cost in MOVE.iter_unpack(self.map[offset + length:offset + length + count * MOVE.size])]
+
+    def record(self, n: int) -> Record:
+        return self.tags(n), self.moves(n), self.costs(n)
+
+    def __getitem__(self, n: int) -> Record:
+        return self.record(n)
+
+    def __iter__(self) -> Iterator[Record]:
+        return (self.record(n) for n in range(self.count))
+
+    def close(self) -> None:
+        self.map.close()
+        self.file.close()
+
+
+def fromGame(game: Game) -> Record:
+    tags = dict(game.tags, White=game.playerW.name, Black=game.playerB.name, Time=repr(game.time), AllowedTime=str(game.allowedTime))
+    if game.start:
+        tags['FEN'] = game.start
+    moves = [(square(*log.sp), square(*log.ep), log.promoted) for log in game.logs]
+    return tags, moves, [log.moveCost for log in game.logs]
+
+
+def toGame(record: Record, trigger=None) -> Game:
+    # Replays a record through Game.move, with the clocks rebuilt from the start time and the move costs.
+    tags, moves, costs = record
+    allowedTime = int(tags['AllowedTime']) if 'AllowedTime' in tags else None
+    game = Game.fromFEN(tags['FEN'], trigger, allowedTime) if 'FEN' in tags else Game(trigger if trigger else lambda: None, allowedTime)
+    game.playerW.name = tags.get('White', game.playerW.name)
+    game.playerB.name = tags.get('Black', game.playerB.name)
+    game.time = float(tags['Time']) if 'Time' in tags else game.time
+    game.tags = {name: value for name, value in tags.items() if name not in CLOCK_TAGS}
+    dt = game.time
+    for (frm, to, promotion), cost in zip(moves, costs):
+        dt += cost
+        game.move(coords(frm), coords(to), promoted=promotion, dt=dt, do=False, moveCost=cost)
+    return game
+
+
+def build(output: str, inputs: List[str], jobs: int = 1) -> int:
+    writer = DatabaseWriter(output)
+    for path in inputs:
+        if path.endswith('.json'):
+            writer.add(*fromGame(Game.loadJson(path, lambda: None, None)))
+        else:
+            for tags, moves in pgn.readGames(path, jobs):
+                writer.add(tags, moves)
+    writer.close()
+    return writer.count
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='build, inspect and export binary game databases.')
+    parser.add_argument('database', help='database file.')
+    parser.add_argument('inputs', nargs='*', help='pgn and json files to build the database from.')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='pgn parsing processes, 0 for one per cpu.')
+    parser.add_argument('-g', '--game', type=int, help='index of the game to export.')
+    parser.add_argument('-o', '--output', help='json or pgn file where to export the game.')
+    args = parser.parse_args()
+
+    if args.inputs:
+        start = time()
+        count = build(args.database, args.inputs, args.jobs)
+        size = sum(getsize(path) for path in args.inputs)
+        print(f"Games: {count}")
+        print(f"Size: {size} -> {getsize(args.database)} bytes")
+        print(f"Time: {time() - start:.3f}s")
+
+    database = Database(args.database)
+    if args.game is not None:
+        game = toGame(database[args.game])
+        if not args.output:
+            print(json.dumps(game.toJSON()))
+        elif args.output.endswith('.json'):
+            game.saveAsJSON(args.output)
+        else:
+            game.saveAsPGN(args.output)
+    elif not args.inputs:
+        print(f"Games: {len(database)}")
+        print(f"Moves: {sum(database.moveCount(n) for n in range(len(database)))}")
+        print(f"Size: {getsize(args.database)} bytes")
+    database.close()
@@ -0,0 +1,106 @@
+from typing import List
+
+# Material weights by piece kind: pawn, bishop, knight, rook, queen, king.
+VALUES = [20, 70, 80, 120, 300, 0]
+# The tables are written in centipawns, a pawn being worth 100 of them and VALUES[0] in the evaluation.
+CENTIPAWN = VALUES[0] / 100
+
+# Piece-square tables seen from white, a8 first like the squares of the board.
+PAWN_TABLE = [
+    0, 0, 0, 0, 0, 0, 0, 0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+    5, 5, 10, 25, 25, 10, 5, 5,
+    0, 0, 0, 20, 20, 0, 0, 0,
+    5, -5, -10, 0, 0, -10, -5, 5,
+    5, 10, 10, -20, -20, 10, 10, 5,
+    0, 0, 0, 0, 0, 0, 0, 0,
+]
+# In the endgame a pawn is worth its way to promotion.
+PAWN_ENDGAME_TABLE = [bonus for bonus in (0, 80, 50, 30, 20, 10, 0, 0) for _ in range(8)]
+BISHOP_TABLE = [
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 10, 10, 5, 0, -10,
+    -10, 5, 5, 10, 10, 5, 5, -10,
+    -10, 0, 10, 10, 10, 10, 0, -10,
+    -10, 10, 10, 10, 10, 10, 10, -10,
+    -10, 5, 0, 0, 0, 0, 5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20,
+]
+KNIGHT_TABLE = [
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20, 0, 0, 0, 0, -20, -40,
+    -30, 0, 10, 15, 15, 10, 0, -30,
+    -30, 5, 15, 20, 20, 15, 5, -30,
+    -30, 0, 15, 20, 20, 15, 0, -30,
+    -30, 5, 10, 15, 15, 10, 5, -30,
+    -40, -20, 0, 5, 5, 0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50,
+]
+ROOK_TABLE = [
+    0, 0, 0, 0, 0, 0, 0, 0,
+    5, 10, 10, 10, 10, 10, 10, 5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    0, 0, 0, 5, 5, 0, 0, 0,
+]
+QUEEN_TABLE = [
+    -20, -10, -10, -5, -5, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 5, 5, 5, 0, -10,
+    -5, 0, 5, 5, 5, 5, 0, -5,
+    0, 0, 5, 5, 5, 5, 0, -5,
+    -10, 5, 5, 5, 5, 5, 0, -10,
+    -10, 0, 5, 0, 0, 0, 0, -10,
+    -20, -10, -10, -5, -5, -10, -10, -20,
+]
+# The king hides behind its pawns while queens and rooks are around, and walks to the center once they are gone.
+KING_TABLE = [
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+    20, 20, 0, 0, 0, 0, 20, 20,
+    20, 30, 10, 0, 0, 10, 30, 20,
+]
+KING_ENDGAME_TABLE = [
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10, 0, 0, -10, -20, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -30, 0, 0, 0, 0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50,
+]
+MIDDLEGAME_TABLES = [PAWN_TABLE, BISHOP_TABLE, KNIGHT_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_TABLE]
+ENDGAME_TABLES = [PAWN_ENDGAME_TABLE, BISHOP_TABLE, KNIGHT_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_ENDGAME_TABLE]
+
+# Weight of every kind in the game phase, from MAX_PHASE with all the pieces down to 0 with pawns and kings only.
+PHASES = [0, 1, 1, 2, 4, 0]
+MAX_PHASE = 24
+
+
+def _scores(tables: List[List[int]]) -> List[List[int]]:
+    # Material and placement of a piece on a square, by Piece.value: positive for white, negative for black,
+    # which reads the tables upside down.
+    return [[(1 if value < 6 else -1) * (VALUES[value % 6] + round(tables[value % 6][sq if value < 6 else sq ^ 56] * CENTIPAWN))
+             for sq in range(64)] for value in range(12)]
+
+
+# Summed by Bitboard.put and remove, so that the evaluation of a position is a single taper().
+MIDDLEGAME = _scores(MIDDLEGAME_TABLES)
+ENDGAME = _scores(ENDGAME_TABLES)
+PIECE_PHASES = PHASES * 2
+
+
+def taper(middlegame: int, endgame: int, phase: int) -> int:
+    # Blend of the two scores, white's point of view; promotions can push the phase over MAX_PHASE.
+    phase = min(phase, MAX_PHASE)
+    return (middlegame * phase + endgame * (MAX_PHASE - phase)) // MAX_PHASE
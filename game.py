@@ -3,7 +3,17 @@ from typing import Dict, List, Tuple
 from time import time
 from datetime import datetime
 from piece import Piece
+from bitboard import ALL_CASTLING, CASTLING, CASTLING_RIGHTS, FLAGS, KING, PAWN, PIECES, PROMOTION, ROOK, ZOBRIST_CASTLING, ZOBRIST_EN_PASSANT, ZOBRIST_SIDE, Bitboard, coords, packMove, square, unpackMove
 import json
+import re
+
+# Standard algebraic notation: piece, origin file, origin rank, capture, destination, promotion.
+SAN = re.compile(r'([BNRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([BNRQ]))?')
+
+# Forsyth-Edwards notation, piece letters indexed by Piece.value.
+FEN_PIECES = 'PBNRQKpbnrqk'
+FEN_CASTLING = 'KQkq'
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
 
 class Result(Enum):
     RUNNING = 0
@@ -34,14 +44,33 @@ class Result(Enum):
             return "Draw"
 
 class LogEntry:
+    # Long games keep thousands of entries: no instance dict, and the move is packed (see bitboard.packMove).
+    __slots__ = ('dt', 'move', 'piece', 'attacked', 'moveCost', 'stats')
+
     def __init__(self, sp: Tuple[int, int], ep: Tuple[int, int], piece: Piece, attacked: Piece, moveCost: float, dt: float = time()) -> None:
         self.dt: float = dt
-        self.sp: Tuple[int, int] = sp
-        self.ep: Tuple[int, int] = ep
+        self.move: int = square(*sp) | square(*ep) << 6
         self.piece: Piece = piece
         self.attacked: Piece = attacked
-        self.promoted: Piece = None
         self.moveCost: float = moveCost
+        # Search statistics (MinMax.stats) of a move played by the engine.
+        self.stats: Dict = None
+
+    @property
+    def sp(self) -> Tuple[int, int]:
+        return coords(self.move & 63)
+
+    @property
+    def ep(self) -> Tuple[int, int]:
+        return coords(self.move >> 6 & 63)
+
+    @property
+    def promoted(self) -> Piece:
+        return unpackMove(self.move)[2]
+
+    @promoted.setter
+    def promoted(self, piece: Piece) -> None:
+        self.move = packMove((self.move & 63, self.move >> 6 & 63, piece))
 
     def __str__(self):
         return f"{datetime.fromtimestamp(self.dt)}: went from {self.sp} to {self.ep} with {self.piece}"
@@ -50,16 +79,25 @@ class LogEntry:
     def __repr__(self):
         return f"{datetime.fromtimestamp(self.dt)}: went from {self.sp} to {self.ep} with {self.piece}" + ("" if self.attacked.hasSameTypeAs(Piece.P1_PAWN) else f" and captured {self.attacked}" )
 
+    # Resolves a SAN move (e4, Nbxd7, O-O, e8=Q+) in the current position of game, without playing it.
     @staticmethod
-    def fromPGN(pgn: str):
-        return
+    def fromPGN(pgn: str, game):
+        move = game.parseSAN(pgn)
+        if not move:
+            raise ValueError(f"illegal or ambiguous move {pgn}")
+        frm, to, promotion = move
+        le = LogEntry(sp=coords(frm), ep=coords(to), piece=game.map.squares[frm], attacked=game.map.squares[to], moveCost=0, dt=time())
+        le.promoted = promotion
+        return le
 
     def toJSON(self) -> Dict:
-        return {'dt': self.dt, 'moveCost': self.moveCost, 'sp': self.sp, 'ep': self.ep, 'piece': self.piece.toJson(), 'attacked': self.attacked.toJson(), 'promoted': self.promoted.toJson() if self.promoted else None}
+        return {'dt': self.dt, 'moveCost': self.moveCost, 'sp': self.sp, 'ep': self.ep, 'piece': self.piece.toJson(), 'attacked': self.attacked.toJson(), 'promoted': self.promoted.toJson() if self.promoted else None, **({'stats': self.stats} if self.stats else {})}
 
     @staticmethod
     def fromJSON(jsonDict: dict, offset):
         le = LogEntry(moveCost=jsonDict['moveCost'], dt=jsonDict['dt']+offset, ep=tuple(jsonDict['ep']), piece=Piece(jsonDict['piece']), attacked=Piece(jsonDict['attacked']), sp=tuple(jsonDict['sp']))
+        le.promoted = Piece(jsonDict['promoted']) if jsonDict.get('promoted') != None else None
+        le.stats = jsonDict.get('stats')
         return le
 
 class Player:
@@ -77,24 +115,251 @@ class Game:
         self.playerW: Player = Player(name="Player White")
         self.playerB: Player = Player(name="Player Black")
         self.upgrade = None
-        self.map: dict[tuple[int, int], Piece] = self.generateMap()
+        self.map: Bitboard = Bitboard.fromMap(self.generateMap())
         self.player = True
+        self.castling: int = ALL_CASTLING
+        self.enPassant: int = None
+        # Plies since the last capture or pawn move, and number of the current move (starting at 1).
+        self.halfMove: int = 0
+        self.fullMove: int = 1
+        # FEN of the position the logs start from, None for the initial position.
+        self.start: str = None
+        # PGN tags of a game read from a file, written back over the defaults of toPGN.
+        self.tags: Dict[str, str] = {}
         self.logs: list[LogEntry] = []
         self.trigger: function[None, None] = trigger
         self.undoes = []
         self.redos = []
         self.abandon: bool = None
         self.draw: bool = None
+        # Optional tablebase.Tablebases adjudicating the positions they cover.
+        self.tablebases = None
+        # (key, moves by origin, check, result) of the current position, see status().
+        self.cached: Tuple = None
 
     def log(self, sp: Tuple, ep: Tuple, piece: Piece, attacked: Piece, moveCost: float, dt: float = time()):
         self.logs.append(LogEntry(sp=sp, ep=ep, piece=piece, dt=dt, attacked=attacked, moveCost=moveCost))
 
     def getAvailableMoves(self, x: int, y: int) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
-        piece: Piece = self.map[x, y]
-        moves = []
-        if self.playable(x, y):
-            moves = piece.getMoves(x=x, y=y, map=self.map, logs=self.logs, casteling = True)
-        return [move for move in moves if not self.check(move=move)]
+        return list(self.status()[0].get((x, y), []))
+
+    # Legal moves grouped by origin, check and result of the position, computed once per position.
+    # move, choice, undo, redo, playLog and loads drop the cache; the key also catches make/unmake on the game.
+    def status(self) -> Tuple[Dict[Tuple[int, int], List[Tuple[Tuple[int, int], Tuple[int, int]]]], bool, Result]:
+        # While a promotion is pending the position is not complete yet, nothing can be played until choice().
+        if self.upgrade:
+            return {}, False, Result.RUNNING
+        key = self.key
+        if self.cached is None or self.cached[0] != key:
+            moves, legal = {}, self.legalMoves()
+            for frm, to, _ in legal:
+                origin = moves.setdefault(coords(frm), [])
+                if (coords(frm), coords(to)) not in origin:
+                    origin.append((coords(frm), coords(to)))
+            check = self.check()
+            found = self.tablebases.probe(self) if self.tablebases else None
+            if found:
+                result = Result.DRAW if not found[0] else Result.P1 if (found[0] > 0) == self.player else Result.P2
+            else:
+                result = Result.RUNNING if moves else Result.DRAW if not check else Result.P2 if self.player else Result.P1
+            self.cached = (key, moves, check, result, legal)
+        return self.cached[1:4]
+
+    def inCheck(self) -> bool:
+        return self.status()[1]
+
+    # legalMoves() of the current position from the status cache, for callers outside the search.
+    def availableMoves(self) -> List[Tuple[int, int, Piece]]:
+        if self.upgrade:
+            return []
+        self.status()
+        return list(self.cached[4])
+
+    def legalMoves(self, origins: int = -1, captures: bool = False) -> List[Tuple[int, int, Piece]]:
+        return self.map.legalMoves(self.player, self.castling, self.enPassant, origins, captures)
+
+    # The same moves in the 16 bit encoding of bitboard.packMove, as used by the search.
+    def packedMoves(self, origins: int = -1, captures: bool = False) -> List[int]:
+        return self.map.packedMoves(self.player, self.castling, self.enPassant, origins, captures)
+
+    @staticmethod
+    def toUci(move: Tuple[int, int, Piece]) -> str:
+        frm, to, promotion = move
+        return f"{chr(ord('a') + frm % 8)}{8 - frm // 8}{chr(ord('a') + to % 8)}{8 - to // 8}" + (promotion.toPGNName().lower() if promotion else '')
+
+    def parseUci(self, text: str) -> Tuple[int, int, Piece]:
+        for move in self.availableMoves():
+            if self.toUci(move) == text:
+                return move
+        return None
+
+    def parseSAN(self, text: str) -> Tuple[int, int, Piece]:
+        san = text.rstrip('+#!?')
+        if san in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+            king = self.map.king(self.player)
+            for move in self.legalMoves(origins=1 << king if king is not None else 0):
+                if abs(move[1] - move[0]) == 2 and (move[1] < move[0]) == (len(san) == 5):
+                    return move
+            return None
+        match = SAN.fullmatch(san)
+        if not match:
+            return None
+        name, file, rank, to, promotion = match.groups()
+        kind = FEN_PIECES.index(name) if name else PAWN
+        to = square(8 - int(to[1]), ord(to[0]) - ord('a'))
+        origins = self.map.pieces[kind + (0 if self.player else 6)]
+        moves = [(frm, dest, promoted) for frm, dest, promoted in self.legalMoves(origins=origins) if dest == to
+                 and (not file or frm % 8 == ord(file) - ord('a')) and (not rank or frm // 8 == 8 - int(rank))
+                 and (promoted.value % 6 if promoted else None) == (FEN_PIECES.index(promotion) if promotion else None)]
+        return moves[0] if len(moves) == 1 else None
+
+    def toSAN(self, move: Tuple[int, int, Piece]) -> str:
+        frm, to, promotion = move
+        kind = self.map.squares[frm].value % 6
+        if kind == KING and abs(to - frm) == 2:
+            san = 'O-O' if to > frm else 'O-O-O'
+        else:
+            capture = self.map.squares[to] != Piece.EMPTY or kind == PAWN and to == self.enPassant
+            origin = ''
+            if kind == PAWN:
+                origin = chr(ord('a') + frm % 8) if capture else ''
+            else:
+                # Disambiguates by file, then by rank, then by both, among the moves of the same kind to the same square.
+                others = [other for other, dest, _ in self.legalMoves(origins=self.map.pieces[kind + (0 if self.player else 6)]) if dest == to and other != frm]
+                if others:
+                    file, rank = chr(ord('a') + frm % 8), str(8 - frm // 8)
+                    origin = file if all(other % 8 != frm % 8 for other in others) else rank if all(other // 8 != frm // 8 for other in others) else file + rank
+            san = ('' if kind == PAWN else FEN_PIECES[kind]) + origin + ('x' if capture else '') + f"{chr(ord('a') + to % 8)}{8 - to // 8}" + (f"={FEN_PIECES[promotion.value % 6]}" if promotion else '')
+        undo = self.make(move)
+        if self.check():
+            san += '+' if self.legalMoves() else '#'
+        self.unmake(undo)
+        return san
+
+    def position(self) -> Tuple:
+        return tuple(self.map.pieces), self.player, self.castling, self.enPassant, self.halfMove, self.fullMove
+
+    @staticmethod
+    def fromPosition(position: Tuple, trigger = None, allowedTime: int = None):
+        g: Game = Game(trigger if trigger else lambda: None, allowedTime=allowedTime)
+        pieces, g.player, g.castling, g.enPassant, g.halfMove, g.fullMove = position
+        g.map = Bitboard.fromPieces(pieces)
+        return g
+
+    def toFEN(self) -> str:
+        rows = []
+        for x in range(8):
+            row, empty = '', 0
+            for y in range(8):
+                piece = self.map[x, y]
+                if piece == Piece.EMPTY:
+                    empty += 1
+                    continue
+                row += (str(empty) if empty else '') + FEN_PIECES[piece.value]
+                empty = 0
+            rows.append(row + (str(empty) if empty else ''))
+        castling = ''.join(letter for i, letter in enumerate(FEN_CASTLING) if self.castling & 1 << i) or '-'
+        enPassant = '-' if self.enPassant is None else f"{chr(ord('a') + self.enPassant % 8)}{8 - self.enPassant // 8}"
+        return f"{'/'.join(rows)} {'w' if self.player else 'b'} {castling} {enPassant} {self.halfMove} {self.fullMove}"
+
+    def loadFEN(self, fen: str) -> None:
+        fields = fen.split()
+        if len(fields) < 4 or len(fields[0].split('/')) != 8 or fields[1] not in ('w', 'b'):
+            raise ValueError(f"invalid FEN {fen}")
+        map = {}
+        for x, row in enumerate(fields[0].split('/')):
+            y = 0
+            for char in row:
+                if char.isdigit():
+                    for _ in range(int(char)):
+                        map[x, y] = Piece.EMPTY
+                        y += 1
+                elif char in FEN_PIECES and y < 8:
+                    map[x, y] = Piece(FEN_PIECES.index(char))
+                    y += 1
+                else:
+                    raise ValueError(f"invalid FEN {fen}")
+            if y != 8:
+                raise ValueError(f"invalid FEN {fen}")
+        if any(char not in FEN_CASTLING for char in fields[2].strip('-')):
+            raise ValueError(f"invalid FEN {fen}")
+        # The en passant square is behind a pawn of the side not to move, which just pushed it two rows.
+        rank, row, pawn = ('6', 3, Piece.P2_PAWN) if fields[1] == 'w' else ('3', 4, Piece.P1_PAWN)
+        if fields[3] != '-' and (len(fields[3]) != 2 or fields[3][0] not in 'abcdefgh' or fields[3][1] != rank or map[row, ord(fields[3][0]) - ord('a')] != pawn):
+            raise ValueError(f"invalid FEN {fen}")
+        if any(not field.isdigit() for field in fields[4:6]):
+            raise ValueError(f"invalid FEN {fen}")
+        self.map = Bitboard.fromMap(map)
+        self.player = fields[1] == 'w'
+        self.castling = sum(1 << FEN_CASTLING.index(char) for char in set(fields[2].strip('-')))
+        # Rights whose king or rook left its square are dropped, as make() would have done.
+        for right, (king, rook, _, _, _) in CASTLING.items():
+            if self.map.squares[king] != PIECES[KING + (0 if king >= 32 else 6)] or self.map.squares[rook] != PIECES[ROOK + (0 if rook >= 32 else 6)]:
+                self.castling &= ~right
+        self.enPassant = None if fields[3] == '-' else square(8 - int(fields[3][1]), ord(fields[3][0]) - ord('a'))
+        self.halfMove = int(fields[4]) if len(fields) > 4 else 0
+        self.fullMove = int(fields[5]) if len(fields) > 5 else 1
+        self.upgrade = None
+        self.cached = None
+        self.start = None if fen == START_FEN else fen
+
+    @staticmethod
+    def fromFEN(fen: str, trigger = None, allowedTime: int = None):
+        g: Game = Game(trigger if trigger else lambda: None, allowedTime=allowedTime)
+        g.loadFEN(fen)
+        return g
+
+    @property
+    def key(self) -> int:
+        return self.map.hash ^ (0 if self.player else ZOBRIST_SIDE) ^ ZOBRIST_CASTLING[self.castling] ^ (0 if self.enPassant is None else ZOBRIST_EN_PASSANT[self.enPassant % 8])
+
+    # Plays a packed move, or a (from, to, promotion) one.
+    def make(self, move: int) -> Tuple:
+        if move.__class__ is not int:
+            move = packMove(move)
+        frm, to, flags = move & 63, move >> 6 & 63, move >> FLAGS
+        board = self.map
+        piece = board.remove(frm)
+        captured = board.remove(to)
+        capturedAt = to
+        kind = piece.value % 6
+        if kind == PAWN and to == self.enPassant:
+            capturedAt = to + (8 if self.player else -8)
+            captured = board.remove(capturedAt)
+        board.put(to, PIECES[(flags & 7) + (0 if self.player else 6)] if flags & PROMOTION else piece)
+        if kind == KING and abs(to - frm) == 2:
+            board.put((frm + to) // 2, board.remove(frm + 3 if to > frm else frm - 4))
+        # (packed move, moved piece, captured piece, captured square, castling rights, en passant square, half and full moves) before the move.
+        undo = (move, piece, captured, capturedAt, self.castling, self.enPassant, self.halfMove, self.fullMove)
+        self.castling &= CASTLING_RIGHTS[frm] & CASTLING_RIGHTS[to]
+        self.enPassant = (frm + to) // 2 if kind == PAWN and abs(to - frm) == 16 else None
+        self.halfMove = 0 if kind == PAWN or captured != Piece.EMPTY else self.halfMove + 1
+        if not self.player:
+            self.fullMove += 1
+        self.player = not self.player
+        return undo
+
+    def makeNull(self) -> int:
+        enPassant = self.enPassant
+        self.enPassant = None
+        self.player = not self.player
+        return enPassant
+
+    def unmakeNull(self, enPassant: int) -> None:
+        self.enPassant = enPassant
+        self.player = not self.player
+
+    def unmake(self, undo: Tuple) -> None:
+        move, piece, captured, capturedAt, self.castling, self.enPassant, self.halfMove, self.fullMove = undo
+        frm, to = move & 63, move >> 6 & 63
+        board = self.map
+        board.remove(to)
+        board.put(frm, piece)
+        if captured != Piece.EMPTY:
+            board.put(capturedAt, captured)
+        if piece.value % 6 == KING and abs(to - frm) == 2:
+            board.put(frm + 3 if to > frm else frm - 4, board.remove((frm + to) // 2))
+        self.player = not self.player
 
     def playable(self, x, y) -> bool:
         return self.map[x, y].isPlayers(self.player)
@@ -103,12 +368,23 @@ class Game:
         map = map if map else self.map
         player = self.player if player == None else player
 
+        if move != None and map is self.map:
+            undo = self.make((square(*move[0]), square(*move[1]), None))
+            king = map.king(player)
+            attacked = king != None and map.isAttacked(king, not player)
+            self.unmake(undo)
+            return attacked
+
         if move != None:
             map = map.copy()
             map[move[1][0], move[1][1]] = map[move[0][0], move[0][1]]
             map[move[0][0], move[0][1]] = Piece.EMPTY
 
-        return len([move for x, y in map for move in [(_, (ax, ay)) for (_, (ax, ay)) in Piece.getMoves(x=x, y=y, map=map, player=not player, logs=self.logs, casteling=False) if map[ax, ay].hasSameTypeAs(Piece.P1_KING)]])>0
+        if not isinstance(map, dict):
+            king = map.king(player)
+            return king != None and map.isAttacked(king, not player)
+
+        return len([move for x, y in map for move in [(_, (ax, ay)) for (_, (ax, ay)) in Piece.getMoves(x=x, y=y, map=map, player=not player, casteling=False) if map[ax, ay].hasSameTypeAs(Piece.P1_KING)]])>0
 
     def getPiece(self, piece: Piece) -> Tuple:
         for i, j in self.map:
@@ -129,10 +405,7 @@ class Game:
         if self.getRemainingTime(False)<=0:
             return Result.P2_TIMEOUT
 
-        for i, j in self.map:
-            if self.getAvailableMoves(i, j) != []:
-                return Result.RUNNING
-        return Result.DRAW if not self.check() else Result.P2 if self.player else Result.P1
+        return self.status()[2]
 
     def isAttaced(self, x: int, y: int, defender: bool = None):
         defender = self.player if defender == None else defender
@@ -145,38 +418,28 @@ class Game:
                     return True
         return False
 
-    def __switch(self, d: Tuple[int, int], s: Tuple[int, int], map: Dict[Tuple[int, int], Piece] = None):
-        map = map if map else self.map
-        map[tuple(d)] = map[tuple(s)]
-        map[tuple(s)] = Piece.EMPTY
-
-    def move(self, frm: Tuple[int, int], to: Tuple[int, int], promoted: Piece = None, dt: float = None, do: bool = True, moveCost: float = None) -> None:
+    def move(self, frm: Tuple[int, int], to: Tuple[int, int], promoted: Piece = None, dt: float = None, do: bool = True, moveCost: float = None) -> Tuple:
         dt = dt if dt != None else time()
         moveCost = moveCost if moveCost != None else (dt - (self.logs[-1].dt if self.logs else self.time))
+        snapshot = self.snapshot()
+        self.cached = None
         (self.playerW if self.player else self.playerB).time += moveCost
         attacked = self.map[to]
-        enPassant = Piece.getEnPassant(*frm, map=self.map, logs=self.logs)
-        if enPassant and enPassant[0] == (frm, to):
-            self.map[frm[0], to[1]] = Piece.EMPTY
-        self.__switch(to, frm)
-        self.player = not self.player
-        direction = (to[1] - frm[1]) / 2
-        if to[0] == frm[0] and abs(direction) == 1 and self.map.get(to).hasSameTypeAs(Piece.P1_KING):
-            direction = int(direction)
-            y = 0 if direction == -1 else 7
-            self.__switch((frm[0], direction + 4), (frm[0], y))
+        undo = self.make((square(*frm), square(*to), None))
+        if do:
+            self.undoes.append((undo,) + snapshot)
+            self.redos.clear()
+        self.log(sp=frm, ep=to, piece=self.map[to], attacked=attacked, dt=dt, moveCost=moveCost)
         if self.map[tuple(to)].hasSameTypeAs(Piece.P1_PAWN) and to[0] in [0, 7]:
             self.upgrade = to
             self.player = not self.player
             if promoted:
                 self.choice(promoted)
-        if do:
-            self.undoes.append(self.toJSON())
-            self.redos.clear()
-        self.log(sp=frm, ep=to, piece=self.map[to], attacked=attacked, dt=dt, moveCost=moveCost)
+        return undo
 
     def choice(self, piece: Piece):
         if self.upgrade:
+            self.cached = None
             self.map[self.upgrade] = piece
             self.player = not self.player
             self.upgrade = None
@@ -190,21 +453,43 @@ class Game:
 
     def saveAsPGN(self, path: str):
         with open(path, 'w') as save:
-            map = Game.generateMap()
-            save.write('[Event "Chess Project"]\n')
-            save.write('[Site "University of Paris (Descartes)"]\n')
-            save.write(f'[DATE "{self.startTime.date().strftime("%Y.%m.%d")}"]')
-            save.write(f'[Round "{self.round}"]\n')
-            save.write(f'[White "{self.playerW.name}"]\n')
-            save.write(f'[Black "{self.playerB.name}"]\n')
-            save.write(f'[Result "{"*" if self.winner()==Result.RUNNING else f"{self.playerW.score}/{self.playerW.score + self.playerB.score}-/{self.playerB.score}/{self.playerW.score + self.playerB.score}"}"]\n')
-            for i in  range(len(self.logs)//2):
-                save.write(f'{i+1}. ' + Piece.toPGN(self.logs[2*i], map) + ' ')
-                self.__switch(self.logs[2*i].ep, self.logs[2*i].sp, map)
-                save.write(Piece.toPGN(self.logs[2*i+1], map) + '\n')
-                self.__switch(self.logs[2*i+1].ep, self.logs[2*i+1].sp, map)
-            if len(self.logs)%2:
-                save.write(f'{len(self.logs)//2+1}. ' + Piece.toPGN(self.logs[-1], map))
+            save.write(self.toPGN())
+
+    # result overrides the Result tag and is written after the moves, tags are added to the header.
+    def toPGN(self, result: str = None, tags: Dict[str, str] = None) -> str:
+        start = Game.fromFEN(self.start) if self.start else Game(lambda: None, None)
+        running = self.winner() == Result.RUNNING
+        # The result stored with a game read from a file is kept.
+        result = result if result else self.tags.get('Result')
+        header = {
+            'Event': 'Chess Project',
+            'Site': 'University of Paris (Descartes)',
+            'Date': self.startTime.date().strftime("%Y.%m.%d"),
+            'Round': str(self.round),
+            'White': self.playerW.name,
+            'Black': self.playerB.name,
+            'Result': "*" if running else f"{self.playerW.score}/{self.playerW.score + self.playerB.score}-/{self.playerB.score}/{self.playerW.score + self.playerB.score}",
+        }
+        header.update(self.tags)
+        header.update(tags or {})
+        if result:
+            header['Result'] = result
+        if self.start:
+            header['SetUp'] = '1'
+            header['FEN'] = self.start
+        text = ''
+        for name, value in header.items():
+            # Backslashes and quotes are escaped in tag values.
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+            text += f'[{name} "{value}"]\n'
+        # A position set up with black to move starts the move text with "N...".
+        for i, log in enumerate(self.logs):
+            if start.player or not i:
+                text += f'{start.fullMove}. ' if start.player else f'{start.fullMove}... '
+            move = (square(*log.sp), square(*log.ep), log.promoted)
+            text += start.toSAN(move) + (' ' if start.player else '\n')
+            start.make(move)
+        return text + (result + '\n' if result else '')
 
     def saveAsJSON(self, path: str):
         with open(path, 'w') as save:
@@ -240,6 +525,10 @@ class Game:
         with open(file, 'r') as pgn:
             pgn = json.load(pgn)
             g.time = pgn['time'] + time() - pgn['save']
+            g.start = pgn.get('fen')
+            g.tags = pgn.get('tags', {})
+            g.playerW.name = g.tags.get('White', g.playerW.name)
+            g.playerB.name = g.tags.get('Black', g.playerB.name)
             g.logs = [LogEntry.fromJSON(log, offset =  g.time - pgn['time']) for log in pgn['log']]
             g.playLog()
         return g
@@ -247,25 +536,42 @@ class Game:
     def toJSON(self):
         log = {'log' : [move.toJSON() for move in self.logs]}
         log['time'] = self.time
+        if self.start:
+            log['fen'] = self.start
+        if self.tags:
+            log['tags'] = self.tags
         log['save'] = time()
         return log
 
+    # Undo and redo also restore the clock references (game start and previous move times), shifted by the
+    # time spent since the snapshot, so that the clock of the player to move resumes where it stopped.
+    def snapshot(self) -> Tuple:
+        return self.player, self.time, self.logs[-1].dt if self.logs else None, time()
+
     def undo(self):
-        self.redos.append(self.toJSON())
-        gs = self.undoes.pop()
-        offset = time() - gs['save']
-        self.time = gs['time'] + offset
-        logs = [LogEntry.fromJSON(log, offset = offset) for log in gs['log']]
-        self.playLog(logs, do=False)
+        undo, player, reference, last, save = self.undoes.pop()
+        log = self.logs.pop()
+        self.redos.append((log, self.snapshot()))
+        offset = time() - save
+        self.cached = None
+        self.unmake(undo)
+        self.player = player
+        self.upgrade = None
+        (self.playerW if player else self.playerB).time -= log.moveCost
+        self.time = reference + offset
+        if self.logs:
+            self.logs[-1].dt = last + offset
         self.trigger()
 
     def redo(self):
-        self.undoes.append(self.toJSON())
-        gs = self.redos.pop()
-        offset = time() - gs['save']
-        self.time = gs['time'] + offset
-        logs = [LogEntry.fromJSON(log, offset = offset) for log in gs['log']]
-        self.playLog(logs, do=False)
+        log, (_, reference, last, save) = self.redos.pop()
+        offset = time() - save
+        snapshot = self.snapshot()
+        undo = self.move(frm=log.sp, to=log.ep, promoted=log.promoted, dt=log.dt + offset, do=False, moveCost=log.moveCost)
+        self.undoes.append((undo,) + snapshot)
+        self.time = reference + offset
+        if len(self.logs) > 1:
+            self.logs[-2].dt = last + offset
         self.trigger()
 
     def playLog(self, logs: List[LogEntry] = None, do = True):
@@ -273,11 +579,7 @@ class Game:
         self.playerB.time = 0
         self.playerW.time = 0
         self.logs.clear()
-        self.map.clear()
-        self.player = True
-        nm = self.generateMap()
-        for k in nm:
-            self.map[k] = nm[k]
+        self.loadFEN(self.start if self.start else START_FEN)
         for move in logs:
             self.move(frm=move.sp, to=move.ep, promoted = move.promoted, do = do, dt=move.dt, moveCost=move.moveCost)
 
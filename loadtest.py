@@ -0,0 +1,108 @@
+import asyncio
+import json
+from argparse import ArgumentParser
+from os import cpu_count
+from random import Random
+from time import perf_counter
+from typing import Dict, List
+from server import Server
+
+
+class Client:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.ids = 0
+
+    async def request(self, **request) -> Dict:
+        self.ids += 1
+        self.writer.write(json.dumps(dict(request, id=self.ids)).encode() + b'\n')
+        await self.writer.drain()
+        return await self.next(reply=self.ids)
+
+    async def next(self, **expected) -> Dict:
+        # Reads up to the message having the expected key and value, the only messages in flight being ours.
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionError('server closed the connection')
+            message = json.loads(line)
+            if all(message.get(key) == value for key, value in expected.items()):
+                return message
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+def percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)] if values else 0.0
+
+
+async def player(host: str, port: int, games: int, plies: int, engine: bool, seed: int, stats: Dict) -> None:
+    # Plays random legal moves, against the engine of the server when engine is set.
+    random = Random(seed)
+    client = Client(*await asyncio.open_connection(host, port, limit=1 << 16))
+    try:
+        for _ in range(games):
+            state = await client.request(op='new', engine='black' if engine else None)
+            for _ in range(plies):
+                if state['status'] != 'running':
+                    break
+                if state['thinking']:
+                    state = await client.next(event='move', game=state['game'])
+                    continue
+                start = perf_counter()
+                state = await client.request(op='move', game=state['game'], move=random.choice(state['moves']))
+                stats['roundTrips'].append(perf_counter() - start)
+                if 'error' in state:
+                    raise ValueError(state['error'])
+                stats['validations'].append(state['elapsed'])
+            await client.request(op='close', game=state['game'])
+            stats['games'] += 1
+    finally:
+        client.close()
+
+
+async def run(host: str, port: int, connections: int, games: int, plies: int, engines: int, seed: int, serve: bool, jobs: int, moveTime: float) -> Dict:
+    # serve starts the server in the same event loop, to test against a local client.
+    server = Server(jobs, moveTime=moveTime) if serve else None
+    listener = await server.start(host, port) if server else None
+    stats = {'games': 0, 'roundTrips': [], 'validations': []}
+    start = perf_counter()
+    try:
+        await asyncio.gather(*(player(host, port, games, plies, i < engines, seed + i, stats) for i in range(connections)))
+    finally:
+        if listener:
+            listener.close()
+            await listener.wait_closed()
+            server.close()
+    stats['time'] = perf_counter() - start
+    return stats
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='load test the game server with clients playing random moves.')
+    parser.add_argument('--host', default='127.0.0.1', help='server address.')
+    parser.add_argument('-p', '--port', type=int, default=8765, help='server port.')
+    parser.add_argument('-c', '--connections', type=int, default=100, help='concurrent clients, one game at a time each.')
+    parser.add_argument('-g', '--games', type=int, default=10, help='games played by every client.')
+    parser.add_argument('-m', '--max-plies', type=int, default=80, help='plies after which a game is closed.')
+    parser.add_argument('-e', '--engines', type=int, default=0, help='clients playing against the engine of the server.')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='seed of the random moves.')
+    parser.add_argument('--serve', action='store_true', help='start the server in this process.')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='engine processes of the server started with --serve.')
+    parser.add_argument('-t', '--movetime', type=float, default=0.05, help='engine time per move of the server started with --serve.')
+    args = parser.parse_args()
+
+    stats = asyncio.run(run(args.host, args.port, args.connections, args.games, args.max_plies, args.engines, args.seed, args.serve, args.jobs, args.movetime))
+    gamesPerSecond = stats['games'] / stats['time']
+    print(f"Games: {stats['games']}")
+    print(f"Moves: {len(stats['roundTrips'])}")
+    print(f"Time: {stats['time']:.3f}s")
+    print(f"Round trip p50: {percentile(stats['roundTrips'], 0.5) * 1000:.2f}ms")
+    print(f"Round trip p99: {percentile(stats['roundTrips'], 0.99) * 1000:.2f}ms")
+    print(f"Validation p50: {percentile(stats['validations'], 0.5) * 1e6:.0f}us")
+    print(f"Validation p99: {percentile(stats['validations'], 0.99) * 1e6:.0f}us")
+    print(f"Games per second: {gamesPerSecond:.1f}")
+    print(f"Games per second per core: {gamesPerSecond / (cpu_count() or 1):.1f}")
@@ -1,6 +1,8 @@
 
 from argparse import Action, ArgumentParser
-from ui import MainUI
+import atexit
+import os
+import profiler
 
 if __name__ == "__main__":
     parser = ArgumentParser()
@@ -8,12 +10,25 @@ if __name__ == "__main__":
     parser.add_argument('-l', '--load', '--load-from', help='file path where to load the game from. Only accepted format is json otherwise unexpected behavior may happen.', nargs=1)
     parser.add_argument('-t', '--time', '--player-timeout', help='player allowed time in seconds.', nargs=1)
     parser.add_argument('-i', '--ia', '--againt-ia', help='start a game against an ia.', const=True, action='store_const')
+    parser.add_argument('-b', '--book', help='opening book file used by the ia, built with book.py.')
+    parser.add_argument('-u', '--uci', help='run the engine without ui, speaking the uci protocol on stdin and stdout.', const=True, action='store_const')
+    parser.add_argument('--tablebases', help='directory of the endgame tables used by the ia, generated with tablebase.py.')
+    parser.add_argument('-P', '--profile', help=f'count and time the engine hot paths, writing the report to PROFILE.json and PROFILE.folded at exit (or set {profiler.ENVIRONMENT}).')
 
     try:
         args = parser.parse_args()
     except:
         exit(0)
-    ui = MainUI(saveDefaultPath=args.save, loadFile=args.load, time=int(args.time[0]) if args.time else None, enableIa = args.ia)
+    profile = args.profile or os.environ.get(profiler.ENVIRONMENT)
+    if profile:
+        profiler.enable()
+        atexit.register(profiler.save, profile)
+    if args.uci:
+        from uci import UCI
+        UCI().run()
+        exit(0)
+    from ui import MainUI
+    ui = MainUI(saveDefaultPath=args.save, loadFile=args.load, time=int(args.time[0]) if args.time else None, enableIa = args.ia, book=args.book, tablebases=args.tablebases)
     ui.initialize()
     ui.construct()
     ui.exec_()
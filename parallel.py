@@ -0,0 +1,91 @@
+from multiprocessing import get_context
+from os import cpu_count
+from time import time
+from typing import Dict, Tuple
+from game import Game
+from IA import MinMax
+from book import OpeningBook
+from transposition import TranspositionTable
+
+# Helper search processes attach to the shared table once, and watch the stop flag set by the main search.
+_table: TranspositionTable = None
+_stop = None
+_options: Dict = None
+
+
+def _initialize(name: str, hashSize: float, stop, options: Dict) -> None:
+    global _table, _stop, _options
+    _table = TranspositionTable(hashSize, name=name)
+    _stop = stop
+    _options = options
+
+
+def _helper(position: Tuple, depth: int, deadline: float, generation: int, index: int) -> Tuple:
+    game = Game.fromPosition(position)
+    ia = MinMax(game, table=_table, **_options)
+    ia.interrupt = lambda: _stop.value
+    # generate() starts a new search, which must land on the generation of the main process.
+    _table.generation = (generation - 1) & 63
+    # Helpers skip the first plies on alternate indices so that they do not all walk the same tree.
+    move = ia.generate(depth=depth, deadline=deadline, startDepth=1 + index % 2)
+    return ia.depth, ia.score, move, ia.nodes
+
+
+# Lazy SMP: helper processes search the same position as the main one and share its transposition table.
+class ParallelSearch:
+    def __init__(self, game: Game, threads: int = None, hashSize: float = 64, maxTime: float = None, book: OpeningBook = None, **options) -> None:
+        self.game = game
+        self.threads = max(1, threads if threads else cpu_count() or 1)
+        self.hashSize = hashSize
+        self.table = TranspositionTable(hashSize, shared=self.threads > 1)
+        # The book stays in the main process, helpers only run when it has no move.
+        self.main = MinMax(game, maxTime=maxTime, table=self.table, book=book, **options)
+        self.nodes: int = 0
+        self.depth: int = 0
+        self.score: int = 0
+        self.pool = None
+        if self.threads > 1:
+            context = get_context('spawn')
+            self.stop = context.Value('b', 0, lock=False)
+            self.pool = context.Pool(self.threads - 1, initializer=_initialize, initargs=(self.table.name, hashSize, self.stop, options))
+
+    @property
+    def interrupt(self):
+        return self.main.interrupt
+
+    @interrupt.setter
+    def interrupt(self, interrupt) -> None:
+        self.main.interrupt = interrupt
+
+    def generate(self, game: Game = None, depth: int = None, moveTime: float = None):
+        game = game if game else self.game
+        if moveTime is None and depth is None:
+            moveTime = self.main.timeBudget(game)
+        deadline = time() + moveTime if moveTime is not None else None
+        if not self.pool or self.main.bookMove(game):
+            move = self.main.generate(game, depth=depth, deadline=deadline)
+            self.nodes, self.depth, self.score = self.main.nodes, self.main.depth, self.main.score
+            return move
+
+        self.stop.value = 0
+        position = game.position()
+        generation = (self.table.generation + 1) & 63
+        helpers = [self.pool.apply_async(_helper, (position, depth, deadline, generation, index)) for index in range(1, self.threads)]
+        move = self.main.generate(game, depth=depth, deadline=deadline)
+        self.stop.value = 1
+        results = [helper.get() for helper in helpers]
+
+        self.depth, self.score = self.main.depth, self.main.score
+        self.nodes = self.main.nodes + sum(nodes for _, _, _, nodes in results)
+        # The main result stands unless a helper completed a deeper iteration.
+        for helperDepth, score, helperMove, _ in results:
+            if helperMove and helperDepth > self.depth:
+                self.depth, self.score, move = helperDepth, score, helperMove
+        return move
+
+    def close(self) -> None:
+        if self.pool:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        self.table.close()
@@ -0,0 +1,114 @@
+from argparse import ArgumentParser
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from time import time
+from typing import Dict, List, Tuple
+from game import Game
+
+# Keys of positions whose subtree count is stored, salted with the remaining depth.
+DEPTH_KEYS = [(0x9E3779B97F4A7C15 * (depth + 1)) & 0xFFFFFFFFFFFFFFFF for depth in range(64)]
+
+
+class PerftTable:
+    def __init__(self, sizeMb: float = 16) -> None:
+        entries = max(1, int(sizeMb * 1024 * 1024) // 16)
+        self.size: int = 1 << (entries.bit_length() - 1)
+        self.mask: int = self.size - 1
+        self.keys = array('Q', bytes(8 * self.size))
+        self.counts = array('Q', bytes(8 * self.size))
+        self.hits: int = 0
+        self.probes: int = 0
+
+    def get(self, key: int, depth: int) -> int:
+        self.probes += 1
+        key ^= DEPTH_KEYS[depth]
+        slot = key & self.mask
+        if self.keys[slot] == key and self.counts[slot]:
+            self.hits += 1
+            return self.counts[slot]
+        return None
+
+    def put(self, key: int, depth: int, count: int) -> None:
+        key ^= DEPTH_KEYS[depth]
+        slot = key & self.mask
+        self.keys[slot] = key
+        self.counts[slot] = count
+
+
+def perft(game: Game, depth: int, table: PerftTable = None) -> int:
+    if depth == 0:
+        return 1
+    moves = game.packedMoves()
+    if depth == 1:
+        return len(moves)
+    if table:
+        key = game.key
+        count = table.get(key, depth)
+        if count is not None:
+            return count
+    count = 0
+    for move in moves:
+        undo = game.make(move)
+        count += perft(game, depth - 1, table)
+        game.unmake(undo)
+    if table:
+        table.put(key, depth, count)
+    return count
+
+
+def _divideMove(position: Tuple, move: Tuple, depth: int, hashSize: float) -> int:
+    game = Game.fromPosition(position)
+    game.make(move)
+    return perft(game, depth - 1, PerftTable(hashSize) if hashSize else None)
+
+
+def divide(game: Game, depth: int, hashSize: float = 0, jobs: int = 1) -> Dict[str, int]:
+    moves = game.legalMoves()
+    if jobs > 1 and depth > 1:
+        position = game.position()
+        with ProcessPoolExecutor(jobs, mp_context=get_context('spawn')) as pool:
+            counts = list(pool.map(_divideMove, [position] * len(moves), moves, [depth] * len(moves), [hashSize] * len(moves)))
+    else:
+        table = PerftTable(hashSize) if hashSize else None
+        counts = []
+        for move in moves:
+            undo = game.make(move)
+            counts.append(perft(game, depth - 1, table))
+            game.unmake(undo)
+    return {Game.toUci(move): count for move, count in zip(moves, counts)}
+
+
+def setup(load: str = None, moves: List[str] = None, fen: str = None) -> Game:
+    game = Game.loadJson(load, lambda: None, None) if load else Game.fromFEN(fen) if fen else Game(lambda: None, None)
+    for text in moves or []:
+        move = game.parseUci(text)
+        if not move:
+            raise ValueError(f"illegal move {text}")
+        game.make(move)
+    return game
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='count the leaf nodes of the legal move tree.')
+    parser.add_argument('depth', type=int, help='depth of the tree.')
+    parser.add_argument('-l', '--load', help='json save to start from instead of the initial position.')
+    parser.add_argument('-f', '--fen', help='position to start from, in Forsyth-Edwards notation.')
+    parser.add_argument('-m', '--moves', nargs='*', help='moves played before counting, as e2e4 e7e8q.')
+    parser.add_argument('-d', '--divide', help='print the count below every root move.', action='store_true')
+    parser.add_argument('--hash', type=float, default=0, help='size in MB of the table caching repeated subtrees, 0 to disable.')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='processes sharing the root moves.')
+    args = parser.parse_args()
+
+    game = setup(args.load, args.moves, args.fen)
+    start = time()
+    counts = divide(game, args.depth, args.hash, args.jobs) if args.depth else {}
+    elapsed = time() - start
+    nodes = sum(counts.values()) if args.depth else 1
+    if args.divide:
+        for move in sorted(counts):
+            print(f"{move}: {counts[move]}")
+        print()
+    print(f"Nodes: {nodes}")
+    print(f"Time: {elapsed:.3f}s")
+    print(f"Nodes per second: {int(nodes / elapsed) if elapsed else nodes}")
@@ -0,0 +1,180 @@
+import re
+import sys
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from os import cpu_count
+from time import time
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+from bitboard import coords
+from game import Game
+from piece import Piece
+
+TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# Comments, variation brackets, annotation glyphs, move numbers, results, then anything else as a move.
+TOKEN = re.compile(r'\{[^}]*\}?|;[^\n]*|[()]|\$\d+|\d+\.+|1-0|0-1|1/2-1/2|\*|[^\s{}();$]+')
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+# A parsed game: (tags, moves as (from, to, promotion) engine moves).
+Record = Tuple[Dict[str, str], List[Tuple[int, int, Piece]]]
+
+
+def report(source: str, line: int, message: str) -> None:
+    print(f"{source}:{line}: skipped game, {message}", file=sys.stderr)
+
+
+def readRaw(path: str) -> Iterator[Tuple[int, str]]:
+    # Yields (first line number, text) of every game, reading the file one line at a time.
+    with open(path, 'r', encoding='utf-8-sig', errors='replace') as file:
+        lines, start, inMoves = [], 1, False
+        for number, line in enumerate(file, 1):
+            stripped = line.strip()
+            if stripped.startswith('[') and inMoves:
+                yield start, ''.join(lines)
+                lines, inMoves = [], False
+            if not lines:
+                if not stripped:
+                    continue
+                start = number
+            inMoves = inMoves or bool(stripped) and not stripped.startswith('[') and not stripped.startswith('%')
+            lines.append(line)
+            # A result closes the game, which separates games written without tags.
+            if inMoves and stripped.split() and stripped.split()[-1] in RESULTS:
+                yield start, ''.join(lines)
+                lines, inMoves = [], False
+        if lines:
+            yield start, ''.join(lines)
+
+
+def tokens(text: str) -> List[str]:
+    # SAN tokens of the main line, with comments, variations, glyphs and move numbers dropped.
+    sans, depth = [], 0
+    for token in TOKEN.findall(text):
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth = max(depth - 1, 0)
+        elif depth or token[0] in '{;$' or token[0].isdigit() and token.rstrip('.') != token or token in RESULTS:
+            continue
+        else:
+            sans.append(token)
+    return sans
+
+
+def parseGame(text: str) -> Record:
+    tags, moveText = {}, []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('%'):
+            continue
+        matches = TAG.findall(stripped) if stripped.startswith('[') else None
+        if matches:
+            for name, value in matches:
+                tags[name] = value.replace('\\"', '"').replace('\\\\', '\\')
+        else:
+            moveText.append(line)
+    if not tags and not moveText:
+        raise ValueError("empty game")
+    game = Game.fromFEN(tags['FEN']) if 'FEN' in tags else Game(lambda: None, None)
+    moves = []
+    for ply, san in enumerate(tokens('\n'.join(moveText))):
+        move = game.parseSAN(san)
+        if not move:
+            raise ValueError(f"illegal or ambiguous move {san} at ply {ply + 1}")
+        game.make(move)
+        moves.append(move)
+    return tags, moves
+
+
+def toGame(record: Record, trigger=None, allowedTime: int = None) -> Game:
+    # Replays a parsed game through Game.move, so that it gets its logs like a game played in the ui.
+    tags, moves = record
+    game = Game.fromFEN(tags['FEN'], trigger, allowedTime) if 'FEN' in tags else Game(trigger if trigger else lambda: None, allowedTime)
+    game.playerW.name = tags.get('White', game.playerW.name)
+    game.playerB.name = tags.get('Black', game.playerB.name)
+    game.tags = dict(tags)
+    for frm, to, promotion in moves:
+        game.move(coords(frm), coords(to), promoted=promotion, dt=game.time, do=False, moveCost=0)
+    return game
+
+
+def _parseChunk(chunk: List[Tuple[int, str]]) -> List[Tuple[int, Record, str]]:
+    results = []
+    for line, text in chunk:
+        try:
+            results.append((line, parseGame(text), None))
+        except (ValueError, IndexError) as error:
+            results.append((line, None, str(error)))
+    return results
+
+
+def _chunks(paths: Iterable[str], size: int) -> Iterator[Tuple[str, List[Tuple[int, str]]]]:
+    for path in paths:
+        chunk = []
+        for game in readRaw(path):
+            chunk.append(game)
+            if len(chunk) == size:
+                yield path, chunk
+                chunk = []
+        if chunk:
+            yield path, chunk
+
+
+def readGames(paths: Iterable[str], jobs: int = 1, chunk: int = 64, onError: Callable[[str, int, str], None] = report) -> Iterator[Record]:
+    # Streams the games of the files in order. With several jobs, chunks of raw games are parsed in a process pool,
+    # with a bounded number of chunks in flight so that memory stays constant whatever the size of the files.
+    if isinstance(paths, str):
+        paths = [paths]
+    jobs = max(1, jobs if jobs else cpu_count() or 1)
+    if jobs == 1:
+        for path, games in _chunks(paths, chunk):
+            yield from _emit(path, _parseChunk(games), onError)
+        return
+    with ProcessPoolExecutor(jobs, mp_context=get_context('spawn')) as pool:
+        pending = deque()
+        for path, games in _chunks(paths, chunk):
+            pending.append((path, pool.submit(_parseChunk, games)))
+            if len(pending) >= 2 * jobs:
+                path, future = pending.popleft()
+                yield from _emit(path, future.result(), onError)
+        while pending:
+            path, future = pending.popleft()
+            yield from _emit(path, future.result(), onError)
+
+
+def _emit(path: str, parsed: List[Tuple[int, Record, str]], onError: Callable[[str, int, str], None]) -> Iterator[Record]:
+    for line, record, error in parsed:
+        if record:
+            yield record
+        elif onError:
+            onError(path, line, error)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='parse pgn files and check every move against the move generator.')
+    parser.add_argument('files', nargs='+', help='pgn files to read.')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='parsing processes, 0 for one per cpu.')
+    parser.add_argument('-c', '--chunk', type=int, default=64, help='games sent to a process at once.')
+    parser.add_argument('-q', '--quiet', help='do not print the skipped games.', action='store_true')
+    args = parser.parse_args()
+
+    skipped = 0
+
+    def onError(path: str, line: int, message: str) -> None:
+        global skipped
+        skipped += 1
+        if not args.quiet:
+            report(path, line, message)
+
+    start = time()
+    games = moves = 0
+    for _, gameMoves in readGames(args.files, args.jobs, args.chunk, onError):
+        games += 1
+        moves += len(gameMoves)
+    elapsed = time() - start
+    print(f"Games: {games}")
+    print(f"Skipped: {skipped}")
+    print(f"Moves: {moves}")
+    print(f"Time: {elapsed:.3f}s")
+    print(f"Games per second: {games / elapsed if elapsed else games:.1f}")
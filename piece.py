@@ -2,8 +2,6 @@ from enum import Enum
 from os.path import join
 from typing import List, Tuple
 
-from PySide6.QtGui import QIcon, QPixmap
-
 class Piece(Enum):
     EMPTY = -1
     P1_PAWN = 0
@@ -23,9 +21,16 @@ class Piece(Enum):
     def __str__(self) -> str:
         return 'empty' if self == self.EMPTY else super(Piece, self).__str__().replace('P1_', 'w').replace('P2_', 'b').lower()[len(self.__class__.__name__) + 1:]
 
-    def getIcon(self) -> QIcon:
+    # Qt is only loaded by the ui, so that the engine runs headless without it.
+    # With a size the svg is rasterised once at that size instead of being scaled on every paint.
+    def getIcon(self, size: int = None):
+        from PySide6.QtCore import QSize
+        from PySide6.QtGui import QIcon, QImageReader, QPixmap
         assets = 'JohnPablok Cburnett Chess set/SVG with shadow/'
-        return QIcon(QPixmap(join(assets, str(self))))
+        reader = QImageReader(join(assets, str(self)))
+        if size:
+            reader.setScaledSize(QSize(size, size))
+        return QIcon(QPixmap.fromImage(reader.read()))
 
     def isPlayers(self, player: bool) -> bool:
         return not self.isEmpty() and (self.value in range(self.P1_PAWN.value, self.P1_KING.value + 1)) == player
@@ -36,18 +41,20 @@ class Piece(Enum):
     def hasSameTypeAs(self, other) -> bool:
         return  not self.isEmpty() and not other.isEmpty() and self.value % Piece.P2_PAWN.value == other.value % Piece.P2_PAWN.value
 
-    def isMoved(self, logs):
-        return self in [log.piece for log in logs]
-
     def isEnemy(self, other):
         return self.isPlayers(False) != other.isPlayers(False)
 
     @staticmethod
-    def isAttacked(tile: Tuple, map: list, player: bool, logs: list):
-        return tile in [move for x in range(8) for y in range(8) for (_, move) in Piece.getMoves(x=x, y=y, map=map, player=not player, logs=logs)]
+    def isAttacked(tile: Tuple, map: list, player: bool):
+        if not isinstance(map, dict):
+            return map.isAttacked(tile[0] * 8 + tile[1], not player)
+        return tile in [move for x in range(8) for y in range(8) for (_, move) in Piece.getMoves(x=x, y=y, map=map, player=not player)]
 
+    # castling is the rights mask of Game.castling and enPassant the target square (x * 8 + y) of Game.enPassant.
     @staticmethod
-    def getMoves(x: int, y: int, map: dict, logs: list, player: bool = None, casteling: bool = False) -> List:
+    def getMoves(x: int, y: int, map: dict, player: bool = None, casteling: bool = False, castling: int = 0, enPassant: int = None) -> List:
+        if not isinstance(map, dict):
+            return map.getMoves(x=x, y=y, player=player, casteling=casteling, castling=castling, enPassant=enPassant)
         player = Piece.isPlayers(map[x, y], True) if player == None else player
         if not Piece._inBoard(x, y) or not map[x, y].isPlayers(player):
             return []
@@ -61,10 +68,10 @@ class Piece(Enum):
             [(x + i, y + j) for i in range(-1, 2) for j in range(-1, 2) if abs(i) + abs(j) != 0 and map[x, y].hasSameTypeAs(Piece.P1_KING)]
 
 
-        return Piece._getPawnMoves(x=x, y=y, map=map, player=player, logs=logs) +\
+        return Piece._getPawnMoves(x=x, y=y, map=map, player=player, enPassant=enPassant) +\
             Piece._explore(x, y, map, player, direction = rec) +\
             [((x, y), (nx, ny)) for nx, ny in checkByTile if Piece.isValidFor(nx, ny, map, player)] +\
-            ([] if not casteling or not map[x, y].hasSameTypeAs(Piece.P1_KING) else Piece._getCastlingMoves(map=map, player=player, logs=logs))
+            ([] if not casteling or not map[x, y].hasSameTypeAs(Piece.P1_KING) else Piece._getCastlingMoves(map=map, player=player, castling=castling))
 
     @staticmethod
     def _explore(x: int, y: int, map: dict, player: bool, stepx: int = None, stepy: int = None, direction: list = None) -> List:
@@ -79,13 +86,14 @@ class Piece(Enum):
         return [(x, y)] if not map[x, y].isEmpty() else ([(x, y)] + Piece._explore(x + stepx, y + stepy, map, player, stepx, stepy))
 
     @staticmethod
-    def _getCastlingMoves(map: dict, player, logs):
+    def _getCastlingMoves(map: dict, player, castling: int):
         x = 7 if player else 0
-        return ([] if map[x, 0].isMoved(logs) or map[x, 4].isEmpty() or map[x, 4].isMoved(logs) or [y for y in range(1, 4) if not map[x, y].isEmpty()] or [y for y in range(1, 5) if Piece.isAttacked(tile=(x, y), map=map, player=player, logs=logs)] else [((x, 4), (x, 2))])+\
-            ([] if map[x, 7].isMoved(logs) or map[x, 4].isEmpty() or map[x, 4].isMoved(logs) or [y for y in range(5, 7) if not map[x, y].isEmpty()] or [y for y in range(4, 7) if Piece.isAttacked(tile=(x, y), map=map, player=player, logs=logs)] else [((x, 4), (x, 6))])
+        king, rook = (Piece.P1_KING, Piece.P1_ROOK) if player else (Piece.P2_KING, Piece.P2_ROOK)
+        return ([] if not castling & (2 if player else 8) or map[x, 0] != rook or map[x, 4] != king or [y for y in range(1, 4) if not map[x, y].isEmpty()] or [y for y in range(2, 5) if Piece.isAttacked(tile=(x, y), map=map, player=player)] else [((x, 4), (x, 2))])+\
+            ([] if not castling & (1 if player else 4) or map[x, 7] != rook or map[x, 4] != king or [y for y in range(5, 7) if not map[x, y].isEmpty()] or [y for y in range(4, 7) if Piece.isAttacked(tile=(x, y), map=map, player=player)] else [((x, 4), (x, 6))])
 
     @staticmethod
-    def _getPawnMoves(x: int, y: int, map, player: bool, logs: list):
+    def _getPawnMoves(x: int, y: int, map, player: bool, enPassant: int = None):
         moves = []
         if not Piece._inBoard(x, y) or not Piece.isPlayers(map[x, y], player) or not map[x, y].hasSameTypeAs(Piece.P1_PAWN):
             return moves
@@ -102,7 +110,7 @@ class Piece(Enum):
         if Piece._inBoard(x + d, y - 1) and Piece.isPlayers(map[x + d, y - 1], not player):
             moves.append(((x, y), (x + d, y - 1)))
 
-        return moves + Piece.getEnPassant(x=x, y=y, map=map, logs=logs)
+        return moves + Piece.getEnPassant(x=x, y=y, map=map, enPassant=enPassant)
 
     @staticmethod
     def _inBoard(x: int, y: int) -> bool:
@@ -113,30 +121,14 @@ class Piece(Enum):
         return Piece._inBoard(x, y) and(map[x, y].isPlayers(not player) or map[x, y].isEmpty())
 
     @staticmethod
-    def getEnPassant(x: int, y: int, map: list, logs: list):
-        if logs:
-            frm = logs[-1].sp
-            to = logs[-1].ep
-            pp = map[x, y]
-            ep = map.get(to)
-            if not abs(to[0] - frm[0]) == 2 or to[0] != x or abs(y - to[1]) != 1 or not pp.hasSameTypeAs(Piece.P1_PAWN) or not ep.hasSameTypeAs(Piece.P1_PAWN) or not pp.isEnemy(ep):
-                return []
-            else:
-                return [((x, y), (to[0] + (frm[0] - to[0]) // 2, to[1]))]
-        else:
+    def getEnPassant(x: int, y: int, map: list, enPassant: int = None):
+        if enPassant is None or not map[x, y].hasSameTypeAs(Piece.P1_PAWN):
             return []
+        ex, ey = divmod(enPassant, 8)
+        if ex != x + (1 if map[x, y].isPlayers(False) else -1) or abs(ey - y) != 1:
+            return []
+        return [((x, y), (ex, ey))]
 
-    @staticmethod
-    def toPGN(log, map):
-        other = map[log.ep]
-        slf = log.piece
-        x, y = log.ep
-        if slf.hasSameTypeAs(Piece.P1_KING) and abs(log.sp[1] - y) == 2:
-            return 'O-O' if y > 4 else 'O-O-O'
-        fr = '' if other.isEmpty() or not slf.hasSameTypeAs(Piece.P1_PAWN) else chr(ord('a')+log.sp[1])
-        return fr+ slf.toPGNName() + ('' if other.isEmpty() else 'x') + chr(ord('a')+y) + str(8-x) + (log.promoted.toPGNName() if log.promoted else '')
-
-# self, other, x, y, _, sy, promotion
     def toPGNName(self):
         return '' if self.hasSameTypeAs(Piece.P1_PAWN) else ('N' if self.hasSameTypeAs(Piece.P1_KNIGHT) else str(self)[1].upper())
 
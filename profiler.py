@@ -0,0 +1,169 @@
+import json
+from argparse import ArgumentParser
+from collections import defaultdict
+from functools import wraps
+from inspect import getattr_static
+from threading import local
+from time import perf_counter
+from typing import Callable, Dict, List
+
+# Set to a file prefix to profile main.py, the report being written to <prefix>.json and <prefix>.folded at exit.
+ENVIRONMENT = 'CHESS_PROFILE'
+
+# Profiling swaps wrappers into the classes, so nothing but the original functions runs while it is disabled.
+enabled = False
+calls: Dict[str, int] = defaultdict(int)
+totals: Dict[str, float] = defaultdict(float)
+selfTimes: Dict[str, float] = defaultdict(float)
+# Self time of every call stack, "outer;inner;function", for flame graphs.
+stacks: Dict[str, float] = defaultdict(float)
+# [hits, misses] of every cache.
+caches: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+# Statistics of every search, from MinMax.stats.
+searches: List[Dict] = []
+originals: Dict = {}
+# TranspositionTable.stats() counters reported per search.
+TABLE_COUNTERS = ('probes', 'hits', 'collisions', 'stores', 'overwrites')
+# The ui searches in a worker thread, every thread keeps its own stack.
+frames = local()
+
+
+def count(cache: str, hit: bool) -> None:
+    caches[cache][0 if hit else 1] += 1
+
+
+def timed(name: str, function: Callable) -> Callable:
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        stack = frames.__dict__.setdefault('stack', [])
+        # name and time spent in the profiled functions it calls
+        stack.append([name, 0.0])
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = perf_counter() - start
+            _, children = stack.pop()
+            calls[name] += 1
+            totals[name] += elapsed
+            selfTimes[name] += elapsed - children
+            stacks[';'.join([frame[0] for frame in stack] + [name])] += elapsed - children
+            if stack:
+                stack[-1][1] += elapsed
+    return wrapper
+
+
+def _status(function: Callable) -> Callable:
+    @wraps(function)
+    def wrapper(game):
+        count('Game.status', game.cached is not None and game.cached[0] == game.key)
+        return function(game)
+    return wrapper
+
+
+def _generate(function: Callable) -> Callable:
+    @wraps(function)
+    def wrapper(engine, *args, **kwargs):
+        before = engine.table.stats()
+        move = function(engine, *args, **kwargs)
+        # Table counters of this search only, the occupation is the one left by the search.
+        table = {name: value - before[name] for name, value in engine.table.stats().items() if name in TABLE_COUNTERS}
+        table['hashfull'] = engine.table.hashfull()
+        caches['TranspositionTable'][0] += table['hits']
+        caches['TranspositionTable'][1] += table['probes'] - table['hits']
+        searches.append(dict(engine.stats, table=table))
+        return move
+    return wrapper
+
+
+def targets() -> List:
+    # (class, function, extra wrapper run outside the timing)
+    from bitboard import Bitboard
+    from game import Game
+    from IA import MinMax
+    from piece import Piece
+    return [(Piece, 'getMoves', None), (Piece, '_explore', None), (Piece, 'isAttacked', None), (Bitboard, 'legalMoves', None),
+            (Bitboard, 'packedMoves', None), (Game, 'make', None), (Game, 'unmake', None), (Game, 'check', None), (Game, 'getAvailableMoves', None), (Game, 'status', _status), (Game, 'winner', None),
+            (MinMax, 'generate', _generate)]
+
+
+def enable() -> None:
+    global enabled
+    if enabled:
+        return
+    for owner, name, extra in targets():
+        original = getattr_static(owner, name)
+        static = isinstance(original, staticmethod)
+        function = timed(f"{owner.__name__}.{name}", original.__func__ if static else original)
+        function = extra(function) if extra else function
+        originals[owner, name] = original
+        setattr(owner, name, staticmethod(function) if static else function)
+    enabled = True
+
+
+def disable() -> None:
+    global enabled
+    for (owner, name), original in originals.items():
+        setattr(owner, name, original)
+    originals.clear()
+    enabled = False
+
+
+def reset() -> None:
+    for values in (calls, totals, selfTimes, stacks, caches):
+        values.clear()
+    searches.clear()
+
+
+def report() -> Dict:
+    return {
+        'functions': {name: {'calls': calls[name], 'time': totals[name], 'self': selfTimes[name], 'average': totals[name] / calls[name]}
+                      for name in sorted(calls, key=selfTimes.get, reverse=True)},
+        'caches': {name: {'hits': hits, 'misses': misses, 'rate': hits / (hits + misses) if hits + misses else 0}
+                   for name, (hits, misses) in caches.items()},
+        'searches': searches,
+    }
+
+
+def saveJSON(path: str) -> None:
+    with open(path, 'w') as file:
+        json.dump(report(), file, indent=1)
+
+
+def saveCollapsed(path: str) -> None:
+    # One "stack microseconds" line per call stack, the input of flamegraph.pl and speedscope.
+    with open(path, 'w') as file:
+        for stack, seconds in sorted(stacks.items()):
+            if int(seconds * 1e6):
+                file.write(f"{stack} {int(seconds * 1e6)}\n")
+
+
+def save(prefix: str) -> None:
+    saveJSON(prefix + '.json')
+    saveCollapsed(prefix + '.folded')
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='summarise a profiling report written by main.py.')
+    parser.add_argument('report', help='json report.')
+    args = parser.parse_args()
+
+    with open(args.report) as file:
+        data = json.load(file)
+    for name, function in data['functions'].items():
+        print(f"{name}: {function['calls']} calls, {function['self']:.3f}s self, {function['time']:.3f}s total, {function['average'] * 1e6:.1f}us per call")
+    for name, cache in data['caches'].items():
+        print(f"{name}: {cache['rate']:.1%} hits ({cache['hits']}/{cache['hits'] + cache['misses']})")
+    if data['searches']:
+        nodes = sum(search['nodes'] for search in data['searches'])
+        time = sum(search['time'] for search in data['searches'])
+        print(f"Searches: {len(data['searches'])}")
+        print(f"Nodes: {nodes}")
+        print(f"Nodes per second: {nodes / max(time, 1e-6):.0f}")
+        tables = [search['table'] for search in data['searches'] if 'table' in search]
+        if tables:
+            probes = max(sum(table['probes'] for table in tables), 1)
+            print(f"Hash hits: {sum(table['hits'] for table in tables) / probes:.1%}")
+            print(f"Hash collisions: {sum(table['collisions'] for table in tables) / probes:.1%}")
+            print(f"Hash overwrites: {sum(table['overwrites'] for table in tables)} of {sum(table['stores'] for table in tables)} stores")
+            print(f"Hashfull: {max(table['hashfull'] for table in tables)}/1000")
@@ -0,0 +1,193 @@
+import asyncio
+import json
+import multiprocessing
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
+from time import perf_counter
+from typing import Dict, Tuple
+from bitboard import coords, square
+from game import Game, Result, START_FEN
+from IA import MinMax
+from piece import Piece
+
+# Protocol: one json object per line. Requests carry an "op" and an optional "id" echoed as "reply" in the
+# answer; moves of the engine are pushed to the owner of the game as {"event": "move", ...}.
+#   {"op": "new", "fen": ..., "time": seconds, "engine": "white" | "black"}
+#   {"op": "move", "game": id, "move": "e2e4"}
+#   {"op": "state" | "resign" | "close", "game": id}
+#   {"op": "stats"}
+
+# Worker process engine, its transposition table reused by all the games searched in the process.
+_engine: MinMax = None
+
+
+def _initialize(hashSize: float) -> None:
+    global _engine
+    _engine = MinMax(Game(lambda: None, None), hashSize=hashSize)
+
+
+def _think(position: Tuple, moveTime: float) -> Tuple[Tuple[int, int], Tuple[int, int], Piece]:
+    return _engine.generate(Game.fromPosition(position), moveTime=moveTime)
+
+
+class Session:
+    def __init__(self, id: int, game: Game, engine: bool, owner: asyncio.StreamWriter) -> None:
+        self.id = id
+        self.game = game
+        # Side played by the engine, None when both sides are played by the client.
+        self.engine = engine
+        self.owner = owner
+        self.thinking = False
+
+
+class Server:
+    def __init__(self, jobs: int = 1, hashSize: float = 4, moveTime: float = 0.1) -> None:
+        self.sessions: Dict[int, Session] = {}
+        self.ids = count(1)
+        self.moveTime = moveTime
+        self.moves = 0
+        # Running engine moves, referenced until they end so that they are not garbage collected.
+        self.tasks = set()
+        self.executor = ProcessPoolExecutor(jobs if jobs > 0 else multiprocessing.cpu_count(), mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_initialize, initargs=(hashSize,))
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8765) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle, host, port, limit=1 << 16)
+
+    def close(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
+
+    @staticmethod
+    def send(writer: asyncio.StreamWriter, message: Dict) -> None:
+        if not writer.is_closing():
+            writer.write(json.dumps(message).encode() + b'\n')
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                request = {}
+                try:
+                    request = json.loads(line)
+                    reply = self.dispatch(request, writer)
+                except (ValueError, KeyError, TypeError) as error:
+                    reply = {'error': str(error)}
+                if isinstance(request, dict) and 'id' in request:
+                    reply['reply'] = request['id']
+                self.send(writer, reply)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            # Games die with the connection of their owner.
+            for session in [session for session in self.sessions.values() if session.owner is writer]:
+                del self.sessions[session.id]
+            writer.close()
+
+    def session(self, request: Dict, writer: asyncio.StreamWriter) -> Session:
+        session = self.sessions.get(request['game'])
+        if not session or session.owner is not writer:
+            raise ValueError(f"no game {request['game']}")
+        return session
+
+    def dispatch(self, request: Dict, writer: asyncio.StreamWriter) -> Dict:
+        op = request['op']
+        if op == 'new':
+            fen = request.get('fen', START_FEN)
+            game = Game.fromFEN(fen, allowedTime=request.get('time')) if fen != START_FEN else Game(lambda: None, request.get('time'))
+            engine = {'white': True, 'black': False}[request['engine']] if request.get('engine') else None
+            id = next(self.ids)
+            session = self.sessions[id] = Session(id, game, engine, writer)
+            self.play(session)
+            return self.state(session)
+        if op == 'move':
+            return self.move(self.session(request, writer), request['move'])
+        if op == 'state':
+            return self.state(self.session(request, writer))
+        if op == 'resign':
+            session = self.session(request, writer)
+            session.game.abandon = session.game.player if session.engine is None else not session.engine
+            return self.state(session)
+        if op == 'close':
+            del self.sessions[self.session(request, writer).id]
+            return {'game': request['game'], 'closed': True}
+        if op == 'stats':
+            return {'games': len(self.sessions), 'thinking': sum(session.thinking for session in self.sessions.values()), 'moves': self.moves}
+        raise ValueError(f"unknown op {op}")
+
+    def move(self, session: Session, text: str) -> Dict:
+        # Validation runs on the event loop: legal moves come from the position cache of the game.
+        start = perf_counter()
+        game = session.game
+        if session.thinking or game.player == session.engine:
+            raise ValueError('not your turn')
+        if game.winner() != Result.RUNNING:
+            raise ValueError('game over')
+        move = game.parseUci(text)
+        if not move:
+            raise ValueError(f"illegal move {text}")
+        game.move(coords(move[0]), coords(move[1]), promoted=move[2], do=False)
+        elapsed = perf_counter() - start
+        self.moves += 1
+        self.play(session)
+        return dict(self.state(session), elapsed=elapsed)
+
+    def play(self, session: Session) -> None:
+        if session.engine is not None and session.game.player == session.engine and session.game.winner() == Result.RUNNING:
+            session.thinking = True
+            task = asyncio.get_running_loop().create_task(self.think(session))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def think(self, session: Session) -> None:
+        # The search runs in the process pool, the event loop keeps serving the other games meanwhile.
+        game = session.game
+        moveTime = min(self.moveTime, max(game.getRemainingTime(game.player), 1) / 20)
+        move = await asyncio.get_running_loop().run_in_executor(self.executor, _think, game.position(), moveTime)
+        session.thinking = False
+        if self.sessions.get(session.id) is not session or game.winner() != Result.RUNNING:
+            return
+        game.move(move[0], move[1], promoted=move[2], do=False)
+        self.moves += 1
+        self.send(session.owner, dict(self.state(session), event='move', move=Game.toUci((square(*move[0]), square(*move[1]), move[2]))))
+        self.play(session)
+
+    @staticmethod
+    def state(session: Session) -> Dict:
+        game = session.game
+        result = game.winner()
+        return {
+            'game': session.id,
+            'fen': game.toFEN(),
+            'player': 'white' if game.player else 'black',
+            'status': 'running' if result == Result.RUNNING else str(result),
+            'clock': {'white': game.getRemainingTime(True), 'black': game.getRemainingTime(False)},
+            'moves': [Game.toUci(move) for move in game.availableMoves()] if result == Result.RUNNING else [],
+            'thinking': session.thinking,
+        }
+
+
+async def serve(host: str, port: int, jobs: int, hashSize: float, moveTime: float) -> None:
+    server = Server(jobs, hashSize, moveTime)
+    listener = await server.start(host, port)
+    print(f"Listening: {host}:{port}", flush=True)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='serve many concurrent games over tcp, one json message per line.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on.')
+    parser.add_argument('-p', '--port', type=int, default=8765, help='port to listen on.')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='engine processes, 0 for one per cpu.')
+    parser.add_argument('-H', '--hash', type=float, default=4, help='transposition table size of every engine process, in MB.')
+    parser.add_argument('-t', '--movetime', type=float, default=0.1, help='search time of the engine per move, in seconds.')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.jobs, args.hash, args.movetime))
+    except KeyboardInterrupt:
+        pass
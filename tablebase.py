@@ -0,0 +1,375 @@
+import struct
+from argparse import ArgumentParser
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from mmap import ACCESS_READ, mmap
+from multiprocessing import get_context
+from os import listdir, makedirs
+from os.path import exists, join
+from time import time
+from typing import List, Tuple
+from bitboard import BISHOP, BISHOP_RAYS, KING, KING_ATTACKS, KNIGHT, KNIGHT_ATTACKS, PAWN, PAWN_ATTACKS, QUEEN, ROOK, ROOK_RAYS, Bitboard, bits, sliderAttacks
+from game import Game
+from piece import Piece
+
+MAGIC = b'CHTB'
+VERSION = 2
+HEADER = struct.Struct('<4sHH')
+# An entry is 0 for a draw, 255 for an impossible placement, otherwise the plies to mate + 1:
+# odd plies when the side to move wins, even ones when it gets mated.
+DRAW, ILLEGAL = 0, 255
+# Piece letters and exchange weights by kind, used to name tables with the stronger side first.
+LETTERS = 'PBNRQK'
+WEIGHTS = [1, 3, 3, 5, 9, 0]
+# Flags of the first pass over a table.
+IMPOSSIBLE, MATE, STALEMATE, DRAWN = 1, 2, 4, 8
+NO_WIN = 255
+# Symmetries of the board as square maps, identity first: the left-right mirror, the top-bottom one, both, then the
+# same four turned around the a8-h1 diagonal. Pawns only allow the left-right mirror.
+FLIPS = [[sq ^ flip for sq in range(64)] for flip in (0, 7, 56, 63)]
+SYMMETRIES = FLIPS + [[(flipped % 8) * 8 + flipped // 8 for flipped in flip] for flip in FLIPS]
+PAWN_SYMMETRIES = FLIPS[:2]
+
+
+def kingPairs(symmetries: List[List[int]]) -> Tuple[List[Tuple[int, List[List[int]]]], List[Tuple[int, int]]]:
+    # Number of the placement of the two kings up to symmetry, and the symmetries taking a placement to the numbered
+    # one (several when it is symmetric itself), for every white king * 64 + black king; None when the kings touch.
+    images = {}
+    for white in range(64):
+        for black in range(64):
+            if white != black and not KING_ATTACKS[white] & (1 << black):
+                images[white << 6 | black] = [(symmetry[white], symmetry[black]) for symmetry in symmetries]
+    kings = sorted(set(min(pairs) for pairs in images.values()))
+    numbers = {pair: number for number, pair in enumerate(kings)}
+    pairs = [None] * 4096
+    for key, found in images.items():
+        pairs[key] = numbers[min(found)], [symmetry for symmetry, image in zip(symmetries, found) if image == min(found)]
+    return pairs, kings
+
+
+KING_PAIRS = kingPairs(SYMMETRIES)
+PAWN_KING_PAIRS = kingPairs(PAWN_SYMMETRIES)
+
+
+def parse(signature: str) -> Tuple[List[int], List[int]]:
+    white, black = signature.upper().split('V')
+    return [LETTERS.index(letter) for letter in white], [LETTERS.index(letter) for letter in black]
+
+
+def canonical(white: List[int], black: List[int]) -> Tuple[str, bool]:
+    # Name of the table holding a material balance, and whether colors must be swapped to look it up.
+    strength = lambda kinds: (sum(WEIGHTS[kind] for kind in kinds), len(kinds), sorted(kinds, reverse=True))
+    mirrored = strength(black) > strength(white)
+    if mirrored:
+        white, black = black, white
+    name = lambda kinds: ''.join(LETTERS[kind] for kind in sorted(kinds, reverse=True))
+    return f"{name(white)}v{name(black)}", mirrored
+
+
+def children(signature: str) -> List[str]:
+    # Tables reached by a capture or a promotion.
+    white, black = parse(signature)
+    found = set()
+    for side, other in ((white, black), (black, white)):
+        for i, kind in enumerate(side):
+            if kind == KING:
+                continue
+            rest = side[:i] + side[i + 1:]
+            found.add(canonical(rest, other)[0])
+            if kind == PAWN:
+                found.update(canonical(rest + [promotion], other)[0] for promotion in (QUEEN, ROOK, BISHOP, KNIGHT))
+    found.discard('KvK')
+    return sorted(found)
+
+
+class Table:
+    def __init__(self, signature: str, path: str = None) -> None:
+        self.signature = signature
+        white, black = parse(signature)
+        # Piece value of every slot of the index: the white pieces, strongest first, then the black ones.
+        self.slots: List[int] = sorted(white, reverse=True) + [kind + 6 for kind in sorted(black, reverse=True)]
+        # The kings are indexed together, the other pieces by kind, identical ones by increasing square.
+        self.others: List[int] = [value for value in self.slots if value % 6 != KING]
+        self.kinds: List[int] = list(dict.fromkeys(self.others))
+        self.pairs, self.kings = PAWN_KING_PAIRS if PAWN in white + black else KING_PAIRS
+        self.size: int = 2 * len(self.kings) * 64 ** len(self.others)
+        self.file = self.values = None
+        if path:
+            self.file = open(path, 'rb')
+            self.values = mmap(self.file.fileno(), 0, access=ACCESS_READ)
+            magic, version, count = HEADER.unpack_from(self.values, 0)
+            if magic != MAGIC or version != VERSION or count != len(self.slots):
+                self.close()
+                raise ValueError(f"{path} is not a {signature} table")
+
+    # index = white to move + 2 * (kings + pairs * (square of other 0 + 64 * square of other 1 + ...)), for the image of the
+    # position by the symmetry giving the smallest index, so that all the images share it. None when the kings touch.
+    def index(self, pieces: List[int], player: bool, mirrored: bool = False) -> int:
+        flip = 56 if mirrored else 0
+        source = lambda value: (value + 6) % 12 if mirrored else value
+        pair = self.pairs[((pieces[source(KING)].bit_length() - 1) ^ flip) << 6 | ((pieces[source(KING + 6)].bit_length() - 1) ^ flip)]
+        if pair is None:
+            return None
+        number, symmetries = pair
+        best = None
+        for symmetry in symmetries:
+            others, factor = 0, 1
+            for value in self.kinds:
+                for sq in sorted(symmetry[sq ^ flip] for sq in bits(pieces[source(value)])):
+                    others += sq * factor
+                    factor *= 64
+            best = others if best is None else min(best, others)
+        return (1 if player != mirrored else 0) + 2 * (number + len(self.kings) * best)
+
+    def decode(self, index: int) -> Tuple[bool, List[int]]:
+        # Squares of the slots, the kings first of their colors as in slots.
+        player, index = index & 1, index >> 1
+        index, number = divmod(index, len(self.kings))
+        kings = list(self.kings[number])
+        squares = []
+        for value in self.slots:
+            if value % 6 == KING:
+                squares.append(kings.pop(0))
+            else:
+                index, sq = divmod(index, 64)
+                squares.append(sq)
+        return bool(player), squares
+
+    def probe(self, index: int) -> int:
+        return self.values[HEADER.size + index]
+
+    def close(self) -> None:
+        if self.values is not None:
+            self.values.close()
+            self.file.close()
+            self.values = None
+
+
+class Tablebases:
+    def __init__(self, directory: str = 'tablebases') -> None:
+        self.directory = directory
+        self.tables = {}
+        names = [name[:-3] for name in listdir(directory) if name.endswith('.tb')] if exists(directory) else []
+        self.available = set(names)
+        self.maxPieces: int = max((len(name) - 1 for name in names), default=2)
+
+    def table(self, signature: str) -> Table:
+        if signature not in self.tables:
+            self.tables[signature] = Table(signature, join(self.directory, signature + '.tb')) if signature in self.available else None
+        return self.tables[signature]
+
+    def probePieces(self, pieces: List[int], player: bool) -> int:
+        # Raw entry of a position, None when its table is missing.
+        white = [kind for kind in range(6) for _ in range(pieces[kind].bit_count())]
+        black = [kind for kind in range(6) for _ in range(pieces[kind + 6].bit_count())]
+        signature, mirrored = canonical(white, black)
+        if signature == 'KvK':
+            return DRAW
+        table = self.table(signature)
+        if not table:
+            return None
+        index = table.index(pieces, player, mirrored)
+        return ILLEGAL if index is None else table.probe(index)
+
+    def probe(self, game: Game) -> Tuple[int, int]:
+        # (1 win, 0 draw or -1 loss for the side to move, plies to mate), None when the position is not covered.
+        board = game.map
+        if game.castling or (board.occupancy[0] | board.occupancy[1]).bit_count() > self.maxPieces:
+            return None
+        # The tables know nothing of en passant, so positions where it can be played are left to the search.
+        if game.enPassant is not None and PAWN_ATTACKS[not game.player][game.enPassant] & board.pieces[PAWN + (0 if game.player else 6)]:
+            return None
+        value = self.probePieces(board.pieces, game.player)
+        if value is None or value == ILLEGAL:
+            return None
+        return (0, 0) if value == DRAW else (1 if value % 2 == 0 else -1, value - 1)
+
+    def bestMove(self, game: Game) -> Tuple[int, int, Piece]:
+        # Quickest mate when winning, longest resistance when losing, any drawing move otherwise.
+        if not self.probe(game):
+            return None
+        best, bestScore = None, None
+        for move in game.legalMoves():
+            undo = game.make(move)
+            found = self.probe(game)
+            game.unmake(undo)
+            if not found:
+                return None
+            result, plies = found
+            score = -result * (1000 - plies) if result else 0
+            if bestScore is None or score > bestScore:
+                best, bestScore = move, score
+        return best
+
+    def close(self) -> None:
+        for table in self.tables.values():
+            if table:
+                table.close()
+        self.tables = {}
+
+
+# Smaller tables opened once per generating process, probed for the positions that captures and promotions lead to.
+_tablebases: Tablebases = None
+
+
+def _initialize(directory: str) -> None:
+    global _tablebases
+    _tablebases = Tablebases(directory)
+
+
+def _analyse(signature: str, start: int, end: int) -> Tuple[bytes, bytes, bytes, bytes]:
+    # First pass over a range of the table: impossible placements, mates and stalemates, the number of moves staying in
+    # the table, and what the moves leaving it (captures and promotions) lead to.
+    table = Table(signature)
+    count = end - start
+    flags, counts, wins, losses = bytearray(count), bytearray(count), bytearray([NO_WIN]) * count, bytearray(count)
+    for offset, index in enumerate(range(start, end)):
+        player, squares = table.decode(index)
+        pieces = [0] * 12
+        for value, sq in zip(table.slots, squares):
+            pieces[value] |= 1 << sq
+        occupied = 0
+        for sq in squares:
+            occupied |= 1 << sq
+        # Only the placement an index is read back from is kept, its symmetric images and reorderings are impossible.
+        board = Bitboard.fromPieces(pieces) if occupied.bit_count() == len(squares) and table.index(pieces, player) == index else None
+        if not board or (pieces[PAWN] | pieces[PAWN + 6]) & 0xFF000000000000FF or board.isAttacked(board.king(not player), player):
+            flags[offset] = IMPOSSIBLE
+            continue
+        moves = board.legalMoves(player)
+        if not moves:
+            flags[offset] = MATE if board.isAttacked(board.king(player), not player) else STALEMATE
+            continue
+        # Moves staying in the table are counted once per position they lead to, as predecessors() finds each once.
+        quiet = set()
+        for frm, to, promotion in moves:
+            child = pieces.copy()
+            moved = board.squares[frm].value
+            if board.squares[to] == Piece.EMPTY and not promotion:
+                child[moved] ^= 1 << frm | 1 << to
+                quiet.add(table.index(child, not player))
+                continue
+            child[moved] ^= 1 << frm
+            if board.squares[to] != Piece.EMPTY:
+                child[board.squares[to].value] ^= 1 << to
+            child[promotion.value if promotion else moved] |= 1 << to
+            value = _tablebases.probePieces(child, not player)
+            if value is None:
+                raise ValueError(f"{signature} needs the tables it captures or promotes into")
+            # A child lost in d plies wins in d + 1, which is the entry value of the child.
+            if value == DRAW:
+                flags[offset] |= DRAWN
+            elif value % 2:
+                wins[offset] = min(wins[offset], value)
+            else:
+                losses[offset] = max(losses[offset], value)
+        counts[offset] = len(quiet)
+    return bytes(flags), bytes(counts), bytes(wins), bytes(losses)
+
+
+def predecessors(table: Table, index: int) -> List[int]:
+    # Positions from which the side that just moved reached this one without capturing or promoting.
+    player, squares = table.decode(index)
+    mover = not player
+    pieces, occupied = [0] * 12, 0
+    for value, sq in zip(table.slots, squares):
+        pieces[value] |= 1 << sq
+        occupied |= 1 << sq
+    found = set()
+    for value, sq in zip(table.slots, squares):
+        if (value < 6) == mover:
+            kind = value % 6
+            if kind == PAWN:
+                step = 8 if mover else -8
+                origins = 0
+                origin = sq + step
+                if 8 <= origin < 56 and not occupied & (1 << origin):
+                    origins |= 1 << origin
+                    if sq // 8 == (4 if mover else 3) and not occupied & (1 << (origin + step)):
+                        origins |= 1 << (origin + step)
+            elif kind == KNIGHT:
+                origins = KNIGHT_ATTACKS[sq] & ~occupied
+            elif kind == KING:
+                origins = KING_ATTACKS[sq] & ~occupied
+            else:
+                origins = ((sliderAttacks(sq, occupied, ROOK_RAYS) if kind != BISHOP else 0) | (sliderAttacks(sq, occupied, BISHOP_RAYS) if kind != ROOK else 0)) & ~occupied
+            for origin in bits(origins):
+                pieces[value] ^= 1 << sq | 1 << origin
+                found.add(table.index(pieces, mover))
+                pieces[value] ^= 1 << sq | 1 << origin
+    found.discard(None)
+    return list(found)
+
+
+def generate(signature: str, directory: str = 'tablebases', jobs: int = 1, log=print) -> str:
+    signature = canonical(*parse(signature))[0]
+    path = join(directory, signature + '.tb')
+    makedirs(directory, exist_ok=True)
+    for child in children(signature):
+        if not exists(join(directory, child + '.tb')):
+            generate(child, directory, jobs, log)
+    start = time()
+    table = Table(signature)
+    size = table.size
+    chunk = max(1, -(-size // (jobs * 16)))
+    ranges = [(signature, begin, min(begin + chunk, size)) for begin in range(0, size, chunk)]
+    if jobs > 1:
+        with ProcessPoolExecutor(jobs, mp_context=get_context('spawn'), initializer=_initialize, initargs=(directory,)) as pool:
+            parts = list(pool.map(_analyse, *zip(*ranges)))
+    else:
+        _initialize(directory)
+        parts = [_analyse(*arguments) for arguments in ranges]
+    flags, counts, wins, losses = (bytearray(b''.join(part[i] for part in parts)) for i in range(4))
+
+    # Retrograde pass, by increasing distance to mate: a position is won as soon as one move reaches a lost one, and
+    # lost once every move reaches a won one, at the distance of the longest of them.
+    values = bytearray(size)
+    buckets = defaultdict(list)
+    for index in range(size):
+        flag = flags[index]
+        if flag & IMPOSSIBLE:
+            values[index] = ILLEGAL
+        elif flag & MATE:
+            buckets[0].append(index)
+        elif wins[index] != NO_WIN:
+            buckets[wins[index]].append(index)
+        elif not counts[index] and losses[index] and not flag & DRAWN:
+            buckets[losses[index]].append(index)
+    distance = 0
+    while buckets:
+        for index in buckets.pop(distance, []):
+            if values[index]:
+                continue
+            values[index] = distance + 1
+            for previous in predecessors(table, index):
+                if values[previous]:
+                    continue
+                if distance % 2 == 0:
+                    buckets[distance + 1].append(previous)
+                else:
+                    counts[previous] -= 1
+                    losses[previous] = max(losses[previous], distance + 1)
+                    if not counts[previous] and wins[previous] == NO_WIN and not flags[previous] & DRAWN:
+                        buckets[losses[previous]].append(previous)
+        distance += 1
+        if distance >= ILLEGAL - 1:
+            raise ValueError(f"{signature} has mates longer than {ILLEGAL - 2} plies")
+
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(table.slots)))
+        file.write(values)
+    wins = sum(1 for value in values if value not in (DRAW, ILLEGAL) and value % 2 == 0)
+    longest = max((value - 1 for value in values if value not in (DRAW, ILLEGAL)), default=None)
+    log(f"{signature}: {size} entries, {wins} won for the side to move, " + (f"longest mate {longest} plies" if longest is not None else "no mate") + f", {time() - start:.1f}s")
+    return path
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='generate endgame tablebases by retrograde analysis.')
+    parser.add_argument('signatures', nargs='+', help='material to generate, as KQvK, KRvK or KPvK. The tables they reduce to are generated first.')
+    parser.add_argument('-d', '--directory', default='tablebases', help='directory of the tables.')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='processes sharing the first pass of every table.')
+    args = parser.parse_args()
+
+    for signature in args.signatures:
+        generate(signature, args.directory, args.jobs)
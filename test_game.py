@@ -0,0 +1,64 @@
+import pytest
+from bitboard import packMove, square
+from game import Game, Result, START_FEN
+from piece import Piece
+
+# (FEN, pawn square, promotion square, chosen piece) of a promotion for each side.
+PROMOTIONS = [('8/P6k/8/8/8/8/8/K7 w - - 0 1', (1, 0), (0, 0), Piece.P1_QUEEN),
+              ('k7/8/8/8/8/8/p6K/8 b - - 0 1', (6, 0), (7, 0), Piece.P2_KNIGHT)]
+
+
+@pytest.mark.parametrize('fen, frm, to, piece', PROMOTIONS)
+def test_promotion_make_unmake(fen, frm, to, piece):
+    game = Game.fromFEN(fen)
+    undo = game.make(packMove((square(*frm), square(*to), piece)))
+    assert game.map[to] == piece
+    game.unmake(undo)
+    assert game.toFEN() == fen
+
+
+@pytest.mark.parametrize('fen, frm, to, piece', PROMOTIONS)
+def test_pending_promotion_lists_no_moves(fen, frm, to, piece):
+    # Game.move leaves the pawn on the last row until choice() is called, as the ui does.
+    game = Game.fromFEN(fen)
+    game.move(frm, to)
+    assert game.upgrade == to
+    assert game.winner() == Result.RUNNING
+    assert game.getAvailableMoves(*to) == []
+    assert game.availableMoves() == []
+    # The pawn waiting for its promotion cannot be pushed off the board.
+    assert all(move[0] != square(*to) for move in game.legalMoves())
+    game.choice(piece)
+    assert game.map[to] == piece
+    assert game.winner() == Result.RUNNING
+
+
+@pytest.mark.parametrize('fen, frm, to, piece', PROMOTIONS)
+def test_undo_restores_full_move(fen, frm, to, piece):
+    game = Game.fromFEN(fen)
+    game.move(frm, to)
+    game.undo()
+    assert game.toFEN() == fen
+    game.move(frm, to, promoted=piece)
+    game.undo()
+    assert game.toFEN() == fen
+
+
+@pytest.mark.parametrize('fen', [START_FEN,
+                                 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+                                 'rnbqkbnr/ppp1pppp/8/3pP3/8/8/PPPP1PPP/RNBQKBNR w KQkq d6 0 3',
+                                 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1',
+                                 '8/8/8/8/8/8/6k1/4K2R w K - 12 40'])
+def test_fen_round_trip(fen):
+    assert Game.fromFEN(fen).toFEN() == fen
+
+
+@pytest.mark.parametrize('fen', ['4k3/8/8/8/8/8/3PP3/4K3 w - e3 0 1',
+                                 'rnbqkbnr/ppp1pppp/8/3pP3/8/8/PPPP1PPP/RNBQKBNR w KQkq e6 0 3',
+                                 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e9 0 1',
+                                 '4k3/8/8/8/8/8/8/4K3 w - - x y',
+                                 '4k3/8/8/8/8/8/8/4K3 w Z - 0 1',
+                                 '4k3/8/8/8/8/8/4K3 w - - 0 1'])
+def test_invalid_fen(fen):
+    with pytest.raises(ValueError):
+        Game.fromFEN(fen)
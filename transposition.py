@@ -0,0 +1,111 @@
+from array import array
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, Tuple
+
+EXACT, LOWER, UPPER = range(3)
+# Every entry is two 64 bit words: the key xor'ed with the data, then the data.
+ENTRY_SIZE = 16
+SCORE_OFFSET = 1 << 31
+
+
+class TranspositionTable:
+    def __init__(self, sizeMb: float = 16, shared: bool = False, name: str = None) -> None:
+        entries = max(1, int(sizeMb * 1024 * 1024) // ENTRY_SIZE)
+        # Keep a power of two so that the slot is a mask of the key.
+        self.size: int = 1 << (entries.bit_length() - 1)
+        self.mask: int = self.size - 1
+        # A shared table lives in shared memory, other processes attach to it by name.
+        self.memory: SharedMemory = None
+        self.owner: bool = name is None
+        if shared or name:
+            self.memory = SharedMemory(name=name, create=name is None, size=self.size * ENTRY_SIZE)
+            self.words = self.memory.buf.cast('Q')
+            self.keys = self.words[:self.size]
+            self.data = self.words[self.size:2 * self.size]
+        else:
+            self.keys = array('Q', bytes(8 * self.size))
+            self.data = array('Q', bytes(8 * self.size))
+        self.generation: int = 0
+        self.resetStats()
+
+    @property
+    def name(self) -> str:
+        return self.memory.name if self.memory else None
+
+    def close(self) -> None:
+        if self.memory:
+            self.keys.release()
+            self.data.release()
+            self.words.release()
+            self.memory.close()
+            if self.owner:
+                self.memory.unlink()
+            self.memory = None
+
+    def resetStats(self) -> None:
+        self.probes: int = 0
+        self.hits: int = 0
+        self.collisions: int = 0
+        self.stores: int = 0
+        self.overwrites: int = 0
+
+    def clear(self) -> None:
+        if self.memory:
+            self.memory.buf[:self.size * ENTRY_SIZE] = bytes(self.size * ENTRY_SIZE)
+        else:
+            self.keys = array('Q', bytes(8 * self.size))
+            self.data = array('Q', bytes(8 * self.size))
+        self.generation = 0
+        self.resetStats()
+
+    def newSearch(self) -> None:
+        self.generation = (self.generation + 1) & 63
+
+    # Moves are stored and returned in the 16 bit encoding of bitboard.packMove, 0 for none.
+    def probe(self, key: int) -> Tuple[int, int, int, int]:
+        self.probes += 1
+        slot = key & self.mask
+        data = self.data[slot]
+        if not data:
+            return None
+        # The xor check also rejects entries torn by a concurrent writer.
+        if self.keys[slot] ^ data != key:
+            self.collisions += 1
+            return None
+        self.hits += 1
+        return data >> 8 & 255, data >> 6 & 3, (data >> 16 & 0xFFFFFFFF) - SCORE_OFFSET, data >> 48
+
+    def store(self, key: int, depth: int, bound: int, score: int, move: int = 0) -> None:
+        slot = key & self.mask
+        old = self.data[slot]
+        if old:
+            sameKey = self.keys[slot] ^ old == key
+            # Depth preferred, but entries left by an older search are always replaced.
+            if not sameKey and (old & 63) == self.generation and (old >> 8 & 255) > depth:
+                return
+            if sameKey and not move:
+                move = old >> 48
+            if not sameKey:
+                self.overwrites += 1
+        self.stores += 1
+        data = (move or 0) << 48 | (score + SCORE_OFFSET) << 16 | min(depth, 255) << 8 | bound << 6 | self.generation
+        self.data[slot] = data
+        self.keys[slot] = key ^ data
+
+    def hashfull(self, sample: int = 1000) -> int:
+        sample = min(sample, self.size)
+        return sum(1 for slot in range(sample) if self.data[slot] and self.data[slot] & 63 == self.generation) * 1000 // sample
+
+    def stats(self) -> Dict:
+        return {
+            'entries': self.size,
+            'bytes': self.size * ENTRY_SIZE,
+            'probes': self.probes,
+            'hits': self.hits,
+            'collisions': self.collisions,
+            'stores': self.stores,
+            'overwrites': self.overwrites,
+            'hitRate': self.hits / self.probes if self.probes else 0,
+            'collisionRate': self.collisions / self.probes if self.probes else 0,
+            'hashfull': self.hashfull(),
+        }
@@ -0,0 +1,182 @@
+import sys
+from threading import Event, Thread
+from typing import Dict, List, TextIO
+from bitboard import square
+from book import OpeningBook
+from game import Game, START_FEN
+from IA import MATE, MATE_BOUND, MAX_DEPTH, VALUES, MinMax
+from parallel import ParallelSearch
+from tablebase import Tablebases
+from transposition import TranspositionTable
+
+# Scores are reported in centipawns, a pawn being worth VALUES[0] in the evaluation.
+CENTIPAWNS = 100 / VALUES[0]
+
+
+class UCI:
+    def __init__(self, input: TextIO = sys.stdin, output: TextIO = sys.stdout) -> None:
+        self.input = input
+        self.output = output
+        self.options: Dict = {'Hash': 16, 'Threads': 1, 'Book': '', 'Tablebases': ''}
+        self.game = Game(lambda: None, None)
+        self.engine = None
+        # Transposition table of the main search, its usage is reported with every depth.
+        self.table: TranspositionTable = None
+        self.thread: Thread = None
+        self.stopped = Event()
+        self.nodeLimit: int = None
+
+    def send(self, line: str) -> None:
+        self.output.write(line + '\n')
+        self.output.flush()
+
+    def newEngine(self) -> None:
+        self.closeEngine()
+        options = {'book': OpeningBook(self.options['Book']) if self.options['Book'] else None,
+                   'tablebases': Tablebases(self.options['Tablebases']) if self.options['Tablebases'] else None}
+        if self.options['Threads'] > 1:
+            self.engine = ParallelSearch(self.game, threads=self.options['Threads'], hashSize=self.options['Hash'], **options)
+            search = self.engine.main
+        else:
+            self.engine = search = MinMax(self.game, hashSize=self.options['Hash'], **options)
+        search.interrupt = lambda: self.stopped.is_set() or self.nodeLimit is not None and search.nodes >= self.nodeLimit
+        search.onProgress = self.info
+        self.table = search.table
+
+    def closeEngine(self) -> None:
+        if isinstance(self.engine, ParallelSearch):
+            self.engine.close()
+        self.engine = None
+
+    def info(self, depth: int, score: int, move, nodes: int, nps: float) -> None:
+        if abs(score) >= MATE_BOUND:
+            plies = MATE - abs(score)
+            value = f"mate {(plies + 1) // 2 if score > 0 else -(plies // 2)}"
+        else:
+            value = f"cp {int(score * CENTIPAWNS)}"
+        pv = Game.toUci((square(*move[0]), square(*move[1]), move[2]))
+        self.send(f"info depth {depth} score {value} nodes {nodes} nps {int(nps)} hashfull {self.table.hashfull()} pv {pv}")
+
+    def run(self) -> None:
+        for line in self.input:
+            if not self.command(line.split()):
+                break
+        self.stop()
+        self.closeEngine()
+
+    def command(self, words: List[str]) -> bool:
+        if not words:
+            return True
+        name, arguments = words[0], words[1:]
+        if name == 'uci':
+            self.send('id name Chess Project')
+            self.send('id author Chess Project')
+            self.send(f"option name Hash type spin default {self.options['Hash']} min 1 max 4096")
+            self.send(f"option name Threads type spin default {self.options['Threads']} min 1 max 64")
+            self.send('option name Book type string default <empty>')
+            self.send('option name Tablebases type string default <empty>')
+            self.send('uciok')
+        elif name == 'isready':
+            self.send('readyok')
+        elif name == 'setoption':
+            self.setOption(arguments)
+        elif name == 'ucinewgame':
+            self.wait()
+            self.closeEngine()
+        elif name == 'position':
+            self.wait()
+            self.position(arguments)
+        elif name == 'go':
+            self.wait()
+            self.go(arguments)
+        elif name == 'stop':
+            self.stop()
+        elif name == 'quit':
+            return False
+        return True
+
+    def setOption(self, arguments: List[str]) -> None:
+        if 'name' not in arguments:
+            return
+        hasValue = 'value' in arguments
+        name = ' '.join(arguments[arguments.index('name') + 1:arguments.index('value') if hasValue else None])
+        value = ' '.join(arguments[arguments.index('value') + 1:]) if hasValue else ''
+        if name in ('Hash', 'Threads'):
+            value = self.integer(name, value)
+            if value is None:
+                return
+            self.options[name] = max(1, value)
+        elif name in ('Book', 'Tablebases'):
+            self.options[name] = '' if value == '<empty>' else value
+        else:
+            return
+        self.wait()
+        self.closeEngine()
+
+    # Malformed numbers are reported and ignored, like malformed positions.
+    def integer(self, name: str, text: str) -> int:
+        try:
+            return int(text)
+        except ValueError:
+            self.send(f"info string invalid {name} {text}")
+            return None
+
+    def position(self, arguments: List[str]) -> None:
+        moves = arguments.index('moves') if 'moves' in arguments else len(arguments)
+        fen = ' '.join(arguments[1:moves]) if arguments and arguments[0] == 'fen' else START_FEN
+        try:
+            self.game = Game.fromFEN(fen)
+        except ValueError as error:
+            self.send(f"info string {error}")
+            self.game = Game(lambda: None, None)
+        for text in arguments[moves + 1:]:
+            move = self.game.parseUci(text)
+            if not move:
+                self.send(f"info string illegal move {text}")
+                break
+            self.game.make(move)
+
+    def go(self, arguments: List[str]) -> None:
+        values = {}
+        for i, word in enumerate(arguments[:-1]):
+            if word in ('depth', 'movetime', 'wtime', 'btime', 'winc', 'binc', 'movestogo', 'nodes'):
+                value = self.integer(word, arguments[i + 1])
+                if value is not None:
+                    values[word] = value
+        depth, moveTime = values.get('depth'), values['movetime'] / 1000 if 'movetime' in values else None
+        remaining = values.get('wtime' if self.game.player else 'btime')
+        if remaining is not None and moveTime is None:
+            increment = values.get('winc' if self.game.player else 'binc', 0)
+            moveTime = min(remaining / values.get('movestogo', 30) + increment * 0.8, remaining / 2) / 1000
+        if depth is None and moveTime is None:
+            # infinite, or nodes only: the search runs until stop or the node limit.
+            depth = MAX_DEPTH
+        self.nodeLimit = values.get('nodes')
+        self.stopped.clear()
+        if not self.engine:
+            self.newEngine()
+        self.thread = Thread(target=self.search, args=(Game.fromPosition(self.game.position()), depth, moveTime, 'infinite' in arguments), daemon=True)
+        self.thread.start()
+
+    def search(self, game: Game, depth: int, moveTime: float, infinite: bool) -> None:
+        self.table.resetStats()
+        move = self.engine.generate(game, depth=depth, moveTime=moveTime)
+        stats = self.table.stats()
+        self.send(f"info string hash hits {stats['hitRate']:.1%} collisions {stats['collisionRate']:.1%} overwrites {stats['overwrites']} of {stats['stores']} stores")
+        # In infinite mode the best move is only sent once the gui asks for it.
+        if infinite:
+            self.stopped.wait()
+        self.send(f"bestmove {Game.toUci((square(*move[0]), square(*move[1]), move[2])) if move else '0000'}")
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.wait()
+
+    def wait(self) -> None:
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+
+if __name__ == "__main__":
+    UCI().run()
@@ -1,12 +1,15 @@
 from IA import MinMax
-from typing import List
+from book import OpeningBook
+from tablebase import Tablebases
+from typing import Dict, List, Tuple
+import profiler
 import PySide6
 
-from PySide6.QtGui import QGuiApplication, QResizeEvent
+from PySide6.QtGui import QGuiApplication, QIcon, QResizeEvent
 from piece import Piece
 from game import Game, Result
 
-from PySide6.QtCore import QSize, QTimer
+from PySide6.QtCore import QSize, QThread, QTimer, Signal
 from PySide6.QtWidgets import QApplication, QFileDialog, QLabel, QMainWindow, QMenuBar, QMessageBox, QPushButton, QWidget
 import functools
 from enum import Enum
@@ -20,8 +23,31 @@ class ColorPalette(Enum):
     CHECK = "#B05080"
     CHOICES_BACKGROUND = "#F0FFFFFF"
 
+class IaWorker(QThread):
+    progress = Signal(int, int, object, int, float)
+    found = Signal(object)
+
+    def __init__(self, ia: MinMax, game: Game, moveTime: float):
+        super(IaWorker, self).__init__()
+        self.ia = ia
+        # The search walks its own copy, so the board on screen never shows the moves being tried.
+        self.game = Game.fromPosition(game.position())
+        self.key = game.key
+        self.moveTime = moveTime
+        self.cancelled = False
+
+    def run(self):
+        self.ia.interrupt = lambda: self.cancelled
+        self.ia.onProgress = self.progress.emit
+        move = self.ia.generate(game=self.game, moveTime=self.moveTime)
+        if not self.cancelled:
+            self.found.emit(move)
+
+    def cancel(self):
+        self.cancelled = True
+
 class MainUI(QApplication):
-    def __init__(self, saveDefaultPath: List[str] = None, loadFile: List[str] = None, time: float = None, enableIa:bool = None):
+    def __init__(self, saveDefaultPath: List[str] = None, loadFile: List[str] = None, time: float = None, enableIa:bool = None, book: str = None, tablebases: str = None):
         super(MainUI, self).__init__(argv)
         if loadFile:
             self.game = Game.loadJson(loadFile[0], self.trigger, allowedTime=time)
@@ -29,7 +55,12 @@ class MainUI(QApplication):
             self.game = Game(self.trigger, allowedTime=time)
         self.enableIa = enableIa
         self.saveDefaultPath = None if not saveDefaultPath or saveDefaultPath.__class__ != list else saveDefaultPath[0]
-        self.ia = MinMax(game=self.game)
+        self.ia = MinMax(game=self.game, book=OpeningBook(book) if book else None, tablebases=Tablebases(tablebases) if tablebases else None)
+        self.worker: IaWorker = None
+        # Icons of the current tile size, and the piece and color last drawn on every tile.
+        self.icons: Dict[Piece, QIcon] = {}
+        self.iconSize: int = None
+        self.tiles: Dict[Tuple[int, int], Tuple[Piece, ColorPalette]] = {}
 
     def initialize(self):
         screen = QGuiApplication.primaryScreen().size()
@@ -61,11 +92,11 @@ class MainUI(QApplication):
         return ColorPalette.TILE_ONE if i % 2 == j % 2 else ColorPalette.TILE_TWO
 
     def onGridClicked(self, i, j):
+        if self.worker:
+            return
         if self.selected != None and (self.selected, (i, j)) in self.previousSuggestions:
             self.game.move(self.selected, (i, j))
-            if self.enableIa and not self.game.player:
-                move = self.ia.generate()
-                self.game.move(frm=move[0], to=move[1])
+            self.playIa()
 
         self.selected = None
         self.previousSuggestions = None
@@ -78,9 +109,42 @@ class MainUI(QApplication):
 
     def onUpgrade(self, pieceIndex):
         self.game.choice(self.getChoices()[pieceIndex])
+        self.playIa()
+
+    def playIa(self):
+        if not self.enableIa or self.game.player or self.game.upgrade or self.game.winner() != Result.RUNNING:
+            return
+        self.cancelIa()
+        self.worker = IaWorker(self.ia, self.game, self.ia.timeBudget(self.game))
+        self.worker.progress.connect(self.onIaProgress)
+        self.worker.found.connect(functools.partial(self.onIaMove, self.worker))
+        self.worker.start()
+
+    def onIaProgress(self, depth: int, score: int, move, nodes: int, nps: float):
+        (si, sj), (ei, ej), _ = move
+        self.window.setWindowTitle(f'Chess - thinking: depth {depth}, {chr(ord("a") + sj)}{8 - si}{chr(ord("a") + ej)}{8 - ei}, {int(nps)} nodes/s')
+
+    def onIaMove(self, worker: IaWorker, move):
+        worker.wait()
+        if worker is not self.worker or worker.cancelled or worker.key != self.game.key:
+            return
+        self.worker = None
+        self.window.setWindowTitle('Chess')
+        if move:
+            self.game.move(frm=move[0], to=move[1], promoted=move[2])
+            self.game.logs[-1].stats = self.ia.stats
+        self.updateView()
+
+    def cancelIa(self):
+        if self.worker:
+            self.worker.cancel()
+            self.worker.wait()
+            self.worker = None
+            self.window.setWindowTitle('Chess')
 
     def updateView(self, event: QResizeEvent = None):
-        self.content.setEnabled(self.game.winner() == Result.RUNNING)
+        winner = self.game.winner()
+        self.content.setEnabled(winner == Result.RUNNING)
         if self.game.upgrade:
             self.choicesView.show()
             self.content.setDisabled(True)
@@ -103,41 +167,57 @@ class MainUI(QApplication):
         self.content.move(0, self.clockContainer.height())
         self.clockB.move(boardSize - self.clockB.width() - self.margin, self.margin)
 
+        # Geometry and icons only change with the tile size, the icon cache is rebuilt for the new size.
+        if self.button_size != self.iconSize:
+            self.iconSize = self.button_size
+            self.icons = {}
+            self.tiles = {}
+            for i, j in self.buttons:
+                self.buttons[i, j].resize(self.button_size, self.button_size)
+                self.buttons[i, j].move(self.button_size * j + self.margin,  self.button_size * i + self.margin)
+                self.buttons[i, j].setIconSize(QSize(self.button_size*2/3, self.button_size*2/3))
+            for i in range(len(self.choicesButtons)):
+                self.choicesButtons[i].setIconSize(QSize(self.button_size*2/3, self.button_size*2/3))
+                self.choicesButtons[i].resize(self.button_size, self.button_size)
+                btnW=self.button_size + self.margin
+                self.choicesButtons[i].move(self.margin//2 + (self.choicesView.width()- btnW*len(self.choicesButtons))//2 + btnW*i, (self.choicesView.height()-self.button_size)//2)
+
+        # Highlights are not drawn once the game is over.
+        colors = self.highlights() if winner == Result.RUNNING else {}
         for i, j in self.buttons:
-            self.buttons[i, j].resize(self.button_size, self.button_size)
-            self.buttons[i, j].move(self.button_size * j + self.margin,  self.button_size * i + self.margin)
-            self.buttons[i, j].setIcon(self.game.map[i, j].getIcon())
-            self.setBackgourdColor(self.buttons[i, j], self.originalTileColor(i, j))
-            self.buttons[i, j].setIconSize(QSize(self.buttons[i, j].width()*2/3, self.buttons[i, j].height()*2/3))
-
-
-        winner = self.game.winner()
+            tile = (self.game.map[i, j], colors.get((i, j), self.originalTileColor(i, j)))
+            if self.tiles.get((i, j)) != tile:
+                self.tiles[i, j] = tile
+                self.buttons[i, j].setIcon(self.getIcon(tile[0]))
+                self.buttons[i, j].setStyleSheet(f"background-color: {tile[1].value};")
 
         if winner != Result.RUNNING:
             self.showDialog(str(winner)+"\nPlease start a new game.", "Info", QMessageBox.Ok, lambda _: None)
             return
 
-        for i in range(len(self.choicesButtons)):
-            self.choicesButtons[i].setIcon(self.getChoices()[i].getIcon())
-            self.choicesButtons[i].setIconSize(QSize(self.button_size*2/3, self.button_size*2/3))
-            self.choicesButtons[i].resize(self.button_size, self.button_size)
-            btnW=self.button_size + self.margin
-            self.choicesButtons[i].move(self.margin//2 + (self.choicesView.width()- btnW*len(self.choicesButtons))//2 + btnW*i, (self.choicesView.height()-self.button_size)//2)
-
-        if self.selected:
-            self.setBackgourdColor(
-                self.buttons[self.selected[0], self.selected[1]], ColorPalette.ACTIVE_COLOR)
+        if self.game.upgrade:
+            for i in range(len(self.choicesButtons)):
+                self.choicesButtons[i].setIcon(self.getIcon(self.getChoices()[i]))
+        self.undo.setEnabled(len(self.game.undoes)>0)
+        self.redo.setEnabled(len(self.game.redos)>0)
 
+    def highlights(self) -> Dict[Tuple[int, int], ColorPalette]:
+        colors = {}
         if(self.previousSuggestions):
             for (_, (mi, mj)) in self.previousSuggestions:
-                self.setBackgourdColor(
-                    self.buttons[mi, mj], ColorPalette.ATTACK if self.game.map[mi, mj] != Piece.EMPTY else ColorPalette.SUGGESTED_MOVE)
-
-        if self.game.check():
-            self.setBackgourdColor(self.buttons[self.game.getPiece(
-                Piece.P1_KING if self.game.player else Piece.P2_KING)], ColorPalette.CHECK)
-        self.undo.setEnabled(len(self.game.undoes)>0)
-        self.redo.setEnabled(len(self.game.redos)>0)
+                colors[mi, mj] = ColorPalette.ATTACK if self.game.map[mi, mj] != Piece.EMPTY else ColorPalette.SUGGESTED_MOVE
+        if self.selected:
+            colors[self.selected] = ColorPalette.ACTIVE_COLOR
+        if self.game.inCheck():
+            colors[self.game.getPiece(Piece.P1_KING if self.game.player else Piece.P2_KING)] = ColorPalette.CHECK
+        return colors
+
+    def getIcon(self, piece: Piece) -> QIcon:
+        if profiler.enabled:
+            profiler.count('MainUI.icons', piece in self.icons)
+        if piece not in self.icons:
+            self.icons[piece] = piece.getIcon(self.iconSize*2//3)
+        return self.icons[piece]
 
     @staticmethod
     def setBackgourdColor(widget: QWidget, color: ColorPalette):
@@ -174,6 +254,9 @@ class MainUI(QApplication):
         self.buttons: List[QPushButton] = {}
         self.selected = None
         self.previousSuggestions = None
+        # New buttons have neither geometry nor icons yet, the next updateView lays them out and draws every tile.
+        self.iconSize = None
+        self.tiles = {}
         for i in range(8):
             for j in range(8):
                 self.buttons[i, j] = QPushButton(self.content)
@@ -187,9 +270,9 @@ class MainUI(QApplication):
         edit = menuBar.addMenu('Edit')
         file.addAction('New Game').triggered.connect(functools.partial(self.newGame,))
         self.undo = edit.addAction('Undo')
-        self.undo.triggered.connect(lambda _: self.game.undo())
+        self.undo.triggered.connect(lambda _: (self.cancelIa(), self.game.undo()))
         self.redo = edit.addAction('Redo')
-        self.redo.triggered.connect(lambda _: self.game.redo())
+        self.redo.triggered.connect(lambda _: (self.cancelIa(), self.game.redo()))
         sv = file.addMenu('Save')
         sv.addAction('as text').triggered.connect(functools.partial(self.save, self.game.saveAsText))
         sv.addAction('as PGN').triggered.connect(functools.partial(self.save, self.game.saveAsPGN))
@@ -224,11 +307,13 @@ class MainUI(QApplication):
         fileName, _ = QFileDialog.getOpenFileName(parent=self.window, filter="JSON (*.json)")
         self.timer.start()
         if fileName:
+            self.cancelIa()
             self.saveDefaultPath = fileName
             self.game: Game = f(fileName, trigger=self.trigger, maxTime=self.game.allowedTime)
             self.updateView()
 
     def newGame(self):
+        self.cancelIa()
         self.game: Game = Game(self.trigger, allowedTime=self.game.allowedTime)
         self.construct()
 
@@ -251,6 +336,7 @@ class MainUI(QApplication):
 
     def abandon(self, value: QPushButton):
         if value.text().lower().count('yes'):
+            self.cancelIa()
             self.game.abandon = self.game.player
             self.updateView()
 